@@ -0,0 +1,203 @@
+"""
+Check a Cluster against stand-in docker daemons, one unix socket per node
+
+Usage:
+    python benchmarks/bench_cluster.py [--nodes N] [--calls N] [--sleep SECONDS]
+
+Starts 'nodes' stand-in daemons (unix sockets in a temporary directory),
+each running a container 'work' whose volume is the same shared directory,
+mounted at a different path in each node, and puts a stand-in 'docker'
+client first in PATH: it asks the daemon of its '-H' socket for 'ps',
+'inspect' and 'exec', then runs exec'd commands locally. Checks that:
+* every node is discovered, with its container;
+* host paths are mapped through each node path to the container path;
+* 'calls' concurrent commands are spread over all nodes;
+* a scheduler shared by the nodes' handles limits each node on its own.
+Reports the time of each step, exits with error if a check fails.
+"""
+import argparse
+import json
+import os
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+# Stand-in 'docker' client: ask the daemon at '-H', then exec locally
+CLIENT = r'''#!PYTHON
+import json, os, socket, sys
+args = sys.argv[1:]
+if args[:1] != ['-H']:
+    sys.exit('Cannot connect to the Docker daemon (no -H)')
+conn = socket.socket(socket.AF_UNIX)
+conn.connect(args[1].split('://', 1)[-1])
+conn.sendall(json.dumps(args[2:]).encode() + b'\n')
+reply = json.loads(conn.makefile().readline())
+sys.stdout.write(reply.get('out', ''))
+sys.stderr.write(reply.get('err', ''))
+sys.stdout.flush()
+if reply.get('exec'):
+    os.execvp(reply['exec'][0], reply['exec'])
+sys.exit(reply.get('code', 0))
+'''
+
+
+class Node(socketserver.ThreadingUnixStreamServer):
+    """
+    Stand-in docker daemon with one running container, counting its execs
+    """
+    daemon_threads = True
+
+    def __init__(self, path, name, container, mount):
+        super().__init__(path, _Handler)
+        self.name = name
+        self.container = container
+        self.mount = mount
+        self.execs = 0
+        self.lock = threading.Lock()
+
+    @property
+    def id(self):
+        return f'{self.name}{self.container}'.ljust(64, '0')
+
+    def inspect(self):
+        source, destination = self.mount
+        return {'Id': self.id, 'Created': '2020-01-01T00:00:00Z', 'Image': 'stand-in',
+                'Name': '/' + self.container,
+                'State': {'Running': True, 'Status': 'running'},
+                'Mounts': [{'Source': source, 'Destination': destination, 'RW': True}],
+                'Config': {'Env': []}, 'HostConfig': {}}
+
+    def answer(self, args):
+        cmd, rest = args[0], args[1:]
+        if cmd == 'ps':
+            return dict(out=f'CONTAINER ID   NAMES\n{self.id[:12]}   {self.container}\n')
+        if cmd == 'inspect':
+            if rest[0] == '-f':
+                return dict(out="'" + json.dumps(self.inspect()['Mounts']) + "'\n")
+            found = [ self.inspect() for n in rest if n in (self.container, self.id) ]
+            return dict(out=json.dumps(found), code=0 if len(found) == len(rest) else 1)
+        if cmd == 'exec':
+            while rest and rest[0].startswith('-'):
+                rest = rest[1:]
+            if rest[0] not in (self.container, self.id):
+                return dict(err=f'Error: No such container: {rest[0]}\n', code=1)
+            argv = rest[1:]
+            if argv[:2] == ['bash', '--login']:
+                argv = ['bash'] + argv[2:]
+            with self.lock:
+                self.execs += 1
+            return dict(exec=argv)
+        return dict(err=f'unsupported: {cmd}\n', code=2)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        args = json.loads(self.rfile.readline())
+        self.wfile.write(json.dumps(self.server.answer(args)).encode() + b'\n')
+
+
+def setup(folder, count):
+    """
+    Start 'count' nodes in 'folder', return (nodes, endpoint paths, local dir)
+    """
+    shared = os.path.join(folder, 'shared')
+    container_dir = os.path.join(folder, 'container')
+    local = os.path.join(folder, 'local')
+    os.makedirs(shared)
+    # container path and local path: both the shared dir, as seen from here
+    os.symlink(shared, container_dir)
+    os.symlink(shared, local)
+
+    bin_dir = os.path.join(folder, 'bin')
+    os.makedirs(bin_dir)
+    client = os.path.join(bin_dir, 'docker')
+    with open(client, 'w') as fp:
+        fp.write(CLIENT.replace('PYTHON', sys.executable, 1))
+    os.chmod(client, os.stat(client).st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    nodes = []
+    paths = {}
+    for i in range(count):
+        node_dir = os.path.join(folder, f'node{i}')
+        os.symlink(shared, node_dir)
+        sock = os.path.join(folder, f'node{i}.sock')
+        node = Node(sock, f'node{i}', 'work', (node_dir, container_dir))
+        threading.Thread(target=node.serve_forever, daemon=True).start()
+        nodes.append(node)
+        paths[f'unix://{sock}'] = [(local, node_dir)]
+    return nodes, paths, local
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--calls', type=int, default=12)
+    parser.add_argument('--sleep', type=float, default=0.5)
+    args = parser.parse_args()
+
+    failed = []
+
+    def check(ok, label, start):
+        print(f"{label:40s} {time.perf_counter() - start:8.3f} s  {'ok' if ok else 'FAIL'}")
+        if not ok:
+            failed.append(label)
+
+    with tempfile.TemporaryDirectory() as folder:
+        nodes, paths, local = setup(folder, args.nodes)
+        # the docker client is found when shoosh is imported
+        import shoosh
+
+        start = time.perf_counter()
+        cluster = shoosh.Cluster(list(paths), paths=paths)
+        check(all('work' in cluster.nodes[e] for e in paths), 'discover nodes', start)
+
+        start = time.perf_counter()
+        data = os.path.join(local, 'input.txt')
+        with open(data, 'w') as fp:
+            fp.write('shared content\n')
+        cat = cluster.wrap('cat', container='work')
+        expected = os.path.join(folder, 'container', 'input.txt')
+        mapped = all(h.wrap('cat').command(data) == f'cat {expected}'
+                     for h in cluster.handles('work'))
+        check(mapped and str(cat(data)) == 'shared content\n', 'map paths through nodes', start)
+
+        start = time.perf_counter()
+        before = [ n.execs for n in nodes ]
+        sleep = cluster.wrap('sleep', container='work')
+        threads = [ threading.Thread(target=sleep, args=(args.sleep,))
+                    for _ in range(args.calls) ]
+        [ t.start() for t in threads ]
+        [ t.join() for t in threads ]
+        spread = [ n.execs - b for n, b in zip(nodes, before) ]
+        check(all(spread), f'spread calls {spread}', start)
+
+        start = time.perf_counter()
+        scheduler = shoosh.Scheduler(max_per_container=1)
+        handles = cluster.handles('work')
+        for h in handles:
+            h.set_scheduler(scheduler)
+        threads = [ threading.Thread(target=h, args=(f'sleep {args.sleep}',))
+                    for h in handles ]
+        [ t.start() for t in threads ]
+        [ t.join() for t in threads ]
+        # one slot per node: all nodes run at once, not one after the other
+        elapsed = time.perf_counter() - start
+        check(elapsed < args.sleep * (1 + (len(handles) - 1) / 2),
+              'scheduler limit per node', start)
+
+        for node in nodes:
+            node.shutdown()
+
+    if failed:
+        print(f"FAIL: {', '.join(failed)}")
+        return 1
+    print("OK: cluster works across stand-in daemons")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
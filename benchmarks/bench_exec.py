@@ -0,0 +1,65 @@
+"""
+Benchmark large (binary) outputs through 'docker exec', with and without TTY
+
+Usage:
+    python benchmarks/bench_exec.py CONTAINER [--size BYTES] [--repeat N]
+
+Runs 'head -c SIZE /dev/urandom' in CONTAINER through a handle running
+commands with a terminal ('tty=True', 'docker exec -t') and one without
+(the default), 'repeat' times each; reports latency (median, best),
+throughput and whether the output arrived intact (SIZE bytes).
+Exits with error if the TTY-less output is altered or not faster.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import shoosh
+
+SIZE = 64 * 2**20
+
+
+def measure(handle, size, repeat):
+    head = handle.wrap('head')
+    times = []
+    intact = True
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = head('-c', size, '/dev/urandom')
+        times.append(time.perf_counter() - start)
+        intact = intact and len(res.stdout) == size
+    return times, intact
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('container')
+    parser.add_argument('--size', type=int, default=SIZE)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for label, tty in (('tty', True), ('no-tty', False)):
+        handle = shoosh.Shoosh()
+        handle.set_docker(args.container, inspect=True, tty=tty)
+        results[label] = measure(handle, args.size, args.repeat)
+
+    for label, (times, intact) in results.items():
+        median = statistics.median(times)
+        print(f"{label:8s} median {median*1e3:8.1f} ms  best {min(times)*1e3:8.1f} ms"
+              f"  {args.size / median / 2**20:8.1f} MiB/s  intact {intact}")
+
+    times, intact = results['no-tty']
+    if not intact:
+        print("FAIL: TTY-less output altered")
+        return 1
+    if statistics.median(times) >= statistics.median(results['tty'][0]):
+        print("FAIL: TTY-less exec not faster")
+        return 1
+    print("OK: TTY-less exec intact and faster")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
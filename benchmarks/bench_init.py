@@ -0,0 +1,83 @@
+"""
+Benchmark 'shoosh.init' end-to-end latency and calls to the docker daemon
+
+Usage:
+    python benchmarks/bench_init.py CONTAINER [--repeat N] [--target SECONDS]
+
+Runs 'shoosh.init(CONTAINER)' without the on-disk cache (cold: a single
+inspect), with it (warm: no docker call) and the same initialization
+without the single inspect ('Shoosh.set_docker') for comparison, 'repeat'
+times each, and reports latency (median, best) and number of docker calls
+per init. Exits with error if the median latency of the cold 'shoosh.init'
+is above 'target'.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import shoosh
+
+TARGET = 0.15
+
+
+def count_calls():
+    """
+    Count calls to the docker client, return the counter (list)
+    """
+    counter = [0]
+    _exec = shoosh.docker._exec
+
+    def _counting(*args, **kwargs):
+        counter[0] += 1
+        return _exec(*args, **kwargs)
+
+    shoosh.docker._exec = _counting
+    return counter
+
+
+def measure(func, repeat, counter):
+    times = []
+    calls = counter[0]
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times, (counter[0] - calls) / repeat
+
+
+def legacy(container):
+    sh = shoosh.Shoosh()
+    sh.set_docker(container, inspect=True)
+    return sh
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('container')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--target', type=float, default=TARGET,
+                        help=f"Maximum median latency in seconds (default {TARGET})")
+    args = parser.parse_args()
+
+    counter = count_calls()
+    results = {
+        'init (cold)': measure(lambda: shoosh.init(args.container, cache=False),
+                               args.repeat, counter),
+        'init (warm)': measure(lambda: shoosh.init(args.container), args.repeat, counter),
+        'set_docker': measure(lambda: legacy(args.container), args.repeat, counter),
+    }
+    for label, (times, calls) in results.items():
+        print(f"{label:12s} median {statistics.median(times)*1e3:8.1f} ms"
+              f"  best {min(times)*1e3:8.1f} ms  docker calls {calls:.0f}")
+
+    median = statistics.median(results['init (cold)'][0])
+    if median > args.target:
+        print(f"FAIL: median init latency above target ({args.target*1e3:.0f} ms)")
+        return 1
+    print(f"OK: median init latency below target ({args.target*1e3:.0f} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Benchmark batch path translation against per-path mapping ('_map_arg')
+
+Usage:
+    python benchmarks/bench_translate.py [--count N] [--sample N]
+
+Translates 'count' host paths under a mapped directory with
+'shoosh._translate.translate' -- list, and numpy/pyarrow arrays if
+installed -- and maps 'sample' existing files one by one with '_map_arg'
+(which looks at the filesystem for each path). Reports time per path,
+checks both give the same paths, and exits with error if the batch
+translation of a list is not faster than per-path mapping.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from shoosh._sh import _map_arg
+from shoosh._translate import translate, numpy, pyarrow
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as host:
+        maps = [(os.path.join(host, 'other'), '/other'), (host, '/data')]
+        sample = []
+        for i in range(args.sample):
+            path = os.path.join(host, f'raster_{i:07d}.tif')
+            open(path, 'w').close()
+            sample.append(path)
+        paths = [ os.path.join(host, f'raster_{i:07d}.tif') for i in range(args.count) ]
+
+        start = time.perf_counter()
+        mapped = [ _map_arg(p, maps) for p in sample ]
+        elapsed = time.perf_counter() - start
+        results = {'_map_arg': elapsed / len(sample)}
+
+        assert translate(sample, maps) == mapped, "Batch and per-path translations differ"
+
+        start = time.perf_counter()
+        translate(paths, maps)
+        results['translate(list)'] = (time.perf_counter() - start) / len(paths)
+
+        if numpy is not None:
+            arr = numpy.array(paths)
+            start = time.perf_counter()
+            translate(arr, maps)
+            results['translate(numpy)'] = (time.perf_counter() - start) / len(paths)
+
+        if pyarrow is not None:
+            arr = pyarrow.array(paths)
+            start = time.perf_counter()
+            translate(arr, maps)
+            results['translate(arrow)'] = (time.perf_counter() - start) / len(paths)
+
+    for label, seconds in results.items():
+        speedup = results['_map_arg'] / seconds
+        print(f"{label:18s} {seconds * 1e9:12.1f} ns/path  x{speedup:8.1f}")
+
+    if results['translate(list)'] >= results['_map_arg']:
+        print("FAIL: batch translation not faster than per-path mapping")
+        return 1
+    print("OK: batch translation faster than per-path mapping")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
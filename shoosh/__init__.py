@@ -6,20 +6,34 @@ from . import _version
 __version__ = _version.get_versions()['version']
 
 from . import _log as log
+from . import _cache
 from ._sh import Shoosh
+from ._sched import Scheduler
+from ._hedge import Replicas
+from ._dag import Workflow
+from ._journal import Journal, batch
 
 try:
     from . import _docker as docker
 except:
     docker = None
+else:
+    from ._pool import Pool
+    from ._tune import Autotuner
+    from ._cluster import Cluster
 
-def init(container:str, mappings=None, name:str=None):
+def init(container:str, mappings=None, name:str=None, cache:bool=True):
     """
     Return a shell for docker 'container' with 'mappings' set
 
     If no mappings are given, shoosh will map all volumes defined for 'container'.
     You can give a 'name' for this instance of shoosh.
 
+    Container details are read from the on-disk cache (see 'shoosh._cache')
+    if 'cache', otherwise -- or if not cached yet -- from the docker daemon.
+    Commands run in the container by ID, so that if the container was
+    recreated, its details are inspected again.
+
     Input:
         container: str
             Name of the container
@@ -30,10 +44,58 @@ def init(container:str, mappings=None, name:str=None):
             Ex: {'option': ('/host/path','/container/path')}
         name: str
             Name for this instance of shoosh (placeholder for planned future)
+        cache: bool
+            Use the on-disk cache of container details
 
     Output:
         shoosh instance
     """
+    info = cache and _cache.load(container)
+    cached = bool(info)
+    if not info:
+        # One call to the daemon: existence, state and volumes of 'container'
+        info = docker.inspect_many([container]).get(container)
+        assert info and info['running'], f"Container '{container}' is not running."
+        if cache:
+            _cache.store(container, info)
     sh = Shoosh(name)
-    sh.set_docker(container, mappings, inspect=True)
+    sh.set_docker(container, mappings, inspect=True, info=info)
+    sh._cached = cached
     return sh
+
+
+def init_many(containers:list, mappings=None, names:list=None) -> list:
+    """
+    Return list of shells for docker 'containers', inspected all at once
+
+    Same as 'init' for each container, but fetching details of all
+    'containers' with one call to the docker daemon.
+    A 'None' is returned for containers not found/running.
+
+    Input:
+        containers: list
+            Names (or IDs) of the containers
+        mappings: list or dict
+            Mappings for all containers (see 'init'); volumes if not given
+        names: list
+            Names for the shoosh instances (same length as 'containers')
+
+    Output:
+        list of shoosh instances
+    """
+    names = names or [None] * len(containers)
+    assert len(names) == len(containers)
+    infos = docker.inspect_many(containers)
+    shells = []
+    for container, name in zip(containers, names):
+        info = infos.get(container)
+        if info and not info['running']:
+            log.error(f"Container '{container}' is not running.")
+            info = None
+        if not info:
+            shells.append(None)
+            continue
+        sh = Shoosh(name)
+        sh.set_docker(container, mappings, inspect=True, info=info)
+        shells.append(sh)
+    return shells
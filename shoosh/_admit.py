@@ -0,0 +1,177 @@
+"""
+Admission of commands according to their declared resources
+"""
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from . import _log as log
+from . import _docker as docker
+
+RESOURCES = ('memory', 'cpus', 'disk')
+
+# Directory (in container) whose free space is the scratch 'disk' capacity
+SCRATCH_DIR = '/tmp'
+
+_UNITS = {'': 1, 'b': 1, 'k': 2**10, 'm': 2**20, 'g': 2**30, 't': 2**40}
+
+# Print: cgroup memory limit, total memory (kB), number of CPUs, free disk (kB)
+_CAPACITY = r"""
+cat /sys/fs/cgroup/memory.max 2>/dev/null \
+    || cat /sys/fs/cgroup/memory/memory.limit_in_bytes 2>/dev/null \
+    || echo max
+awk '/^MemTotal:/ {print $2}' /proc/meminfo
+nproc 2>/dev/null || getconf _NPROCESSORS_ONLN
+df -Pk "$1" | awk 'NR==2 {print $4}'
+"""
+
+_admissions = {}
+_admissions_lock = threading.Lock()
+
+
+def admission(container:str, host:str=None):
+    """
+    Return the Admission (shared) of 'container' (at docker 'host')
+    """
+    with _admissions_lock:
+        if (host, container) not in _admissions:
+            _admissions[(host, container)] = Admission(container, host=host)
+        return _admissions[(host, container)]
+
+
+class Admission(object):
+    """
+    Admit commands in 'container' while their declared resources fit in it
+
+    Commands declare the resources they need -- 'memory' and 'disk' (bytes,
+    or strings like '4g'), 'cpus' (number) -- and wait until the sum of
+    resources of admitted commands leaves room for them. Any waiting command
+    that fits is admitted, so small commands are not held behind big ones;
+    commands not declaring resources are not subject to admission.
+
+    Capacities are read from the container limits (inspect, cgroups), or the
+    resources seen from within the container if not limited; they can be
+    given explicitly with 'capacity' (eg, {'memory': '8g', 'cpus': 4}).
+    """
+    def __init__(self, container:str, capacity:dict=None, host:str=None):
+        self._container = container
+        self._capacity = _container_capacity(container, host)
+        self._capacity.update(parse_resources(capacity or {}))
+        self._admitted = dict.fromkeys(RESOURCES, 0)
+        self._waiting = 0
+        self._cond = threading.Condition()
+        log.debug(f"Container '{container}' capacity: {self._capacity}")
+
+    @property
+    def capacity(self) -> dict:
+        return dict(self._capacity)
+
+    @property
+    def admitted(self) -> dict:
+        return dict(self._admitted)
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def acquire(self, resources:dict, timeout:float=None):
+        """
+        Wait until 'resources' fit in container, raise TimeoutError after 'timeout'
+        """
+        request = parse_resources(resources)
+        for k,v in request.items():
+            if self._capacity.get(k) is not None and v > self._capacity[k]:
+                msg = (f"Requested {k} ({v}) above container '{self._container}'"
+                       f" capacity ({self._capacity[k]})")
+                log.error(msg)
+                raise ValueError(msg)
+
+        deadline = timeout is not None and time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._fits(request):
+                    wait = deadline and deadline - time.monotonic()
+                    if wait is not False and wait <= 0:
+                        raise TimeoutError(f"Resources not available in '{self._container}'")
+                    self._cond.wait(wait or None)
+            finally:
+                self._waiting -= 1
+            for k,v in request.items():
+                self._admitted[k] += v
+        return request
+
+    def release(self, request:dict):
+        """
+        Give back resources 'request' (as returned by 'acquire')
+        """
+        with self._cond:
+            for k,v in request.items():
+                self._admitted[k] -= v
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, resources:dict, timeout:float=None):
+        """
+        Context manager holding 'resources' in container
+        """
+        request = self.acquire(resources, timeout)
+        try:
+            yield
+        finally:
+            self.release(request)
+
+    def _fits(self, request):
+        for k,v in request.items():
+            cap = self._capacity.get(k)
+            if cap is not None and self._admitted[k] + v > cap:
+                return False
+        return True
+
+
+def parse_resources(resources:dict) -> dict:
+    """
+    Return 'resources' with sizes (memory, disk) in bytes
+    """
+    out = {}
+    for k,v in resources.items():
+        if k not in RESOURCES:
+            raise ValueError(f"Unknown resource '{k}', options are {RESOURCES}")
+        out[k] = float(v) if k == 'cpus' else parse_size(v)
+    return out
+
+
+def parse_size(size) -> int:
+    """
+    Return 'size' in bytes (eg, 512, '512m', '4G', '1.5g')
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    size = size.strip().lower()
+    if size.endswith('ib'):
+        size = size[:-2]
+    elif size.endswith('b') and size[-2:-1].isalpha():
+        size = size[:-1]
+    unit = size[-1] if size[-1:].isalpha() else ''
+    number = size[:-1] if unit else size
+    return int(float(number) * _UNITS[unit])
+
+
+def _container_capacity(container, host=None):
+    info = docker.inspect_many([container], host).get(container) or {}
+    buf = StringIO()
+    res = docker.execute(container, 'sh', '-c', _CAPACITY, 'shoosh-capacity',
+                         SCRATCH_DIR, host=host, _out=buf)
+    lines = buf.getvalue().split() if res is not None else []
+    if len(lines) < 4:
+        log.warning(f"Could not read container '{container}' capacity")
+        return dict(memory=None, cpus=info.get('cpus'), disk=None)
+
+    cgroup_mem, total_mem, nproc, free_disk = lines[:4]
+    memory = int(total_mem) * 1024
+    if cgroup_mem.isdigit():
+        memory = min(memory, int(cgroup_mem))
+    return dict(memory = memory,
+                cpus = info.get('cpus') or int(nproc),
+                disk = int(free_disk) * 1024)
@@ -0,0 +1,279 @@
+"""
+In-container agent running concurrent commands over one 'docker exec' channel
+"""
+import json
+import signal
+import struct
+import subprocess
+import threading
+from concurrent.futures import Future
+
+import sh
+
+from . import _log as log
+from . import _docker as docker
+
+# Frame header: type, job id, payload length
+HEADER = struct.Struct('>BII')
+
+HELLO = 0       # agent -> host: agent ready
+START = 1       # host -> agent: run argv (JSON payload) as job
+OUT = 2         # agent -> host: stdout chunk of job
+ERR = 3         # agent -> host: stderr chunk of job
+EXIT = 4        # agent -> host: exit status of job (signed int)
+
+# Interpreter (in container) running the agent
+PYTHON = 'python3'
+
+# Agent source, run with 'python3 -c' (Python 3 standard library only)
+AGENT = r'''
+import json, os, struct, subprocess, sys, threading
+H = struct.Struct('>BII')
+lock = threading.Lock()
+def send(kind, job, data=b''):
+    frame = H.pack(kind, job, len(data)) + data
+    with lock:
+        while frame:
+            frame = frame[os.write(1, frame):]
+def read(n):
+    buf = b''
+    while len(buf) < n:
+        chunk = os.read(0, n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+def pump(job, pipe, kind):
+    for chunk in iter(lambda: os.read(pipe.fileno(), 65536), b''):
+        send(kind, job, chunk)
+def run(job, argv):
+    try:
+        p = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    except OSError as e:
+        send(3, job, str(e).encode()); send(4, job, struct.pack('>i', 127)); return
+    procs.add(p)
+    ts = [threading.Thread(target=pump, args=(job, p.stdout, 2)),
+          threading.Thread(target=pump, args=(job, p.stderr, 3))]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    send(4, job, struct.pack('>i', p.wait()))
+    procs.discard(p)
+procs = set()
+send(0, 0)
+while True:
+    head = read(H.size)
+    if head is None:
+        break
+    kind, job, size = H.unpack(head)
+    data = read(size) if size else b''
+    if data is None:
+        break
+    if kind == 1:
+        threading.Thread(target=run, args=(job, json.loads(data)), daemon=True).start()
+for p in list(procs):
+    p.terminate()
+'''
+
+
+class Result(object):
+    """
+    Result of a command run by the agent: 'exit_code', 'stdout' and 'stderr'
+
+    Output is kept as bytes, 'str(result)' decodes stdout.
+    """
+    def __init__(self, command, exit_code, stdout, stderr):
+        self.command = command
+        self.exit_code = exit_code
+        self.stdout = stdout
+        self.stderr = stderr
+
+    def __str__(self):
+        return self.stdout.decode(errors='replace')
+
+    def __repr__(self):
+        return str(self)
+
+
+class Agent(object):
+    """
+    Agent in 'container' running commands concurrently, all through one exec
+
+    The agent (a small Python program, see 'AGENT') is started once with
+    'docker exec -i', reading command requests from its stdin and sending
+    back -- interleaved in frames tagged by job -- the stdout, stderr and exit
+    status of each. Commands submitted from any thread share that channel.
+
+    If the container has no Python interpreter, the agent is not 'available'
+    and commands should run through 'docker exec' each.
+    """
+    def __init__(self, container:str, host:str=None, shell:str=docker.SHELL_COMMAND):
+        self._container = container
+        self._shell = shell.split()
+        self._jobs = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._reading = True
+        argv = docker.exec_argv(container, host)
+        argv = argv[:argv.index(container) + 1] + [PYTHON, '-c', AGENT]
+        self._proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+        self.available = self._hello()
+        if self.available:
+            threading.Thread(target=self._read, daemon=True).start()
+            log.debug(f"Agent running in '{container}'")
+        else:
+            log.warning(f"Agent could not start in '{container}' (no {PYTHON}?)")
+            self.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.available and self._reading and self._proc.poll() is None
+
+    def submit(self, command:str, out=None, err=None) -> Future:
+        """
+        Start 'command' line, return Future of its 'Result'
+
+        Lines of output (error output) are given to 'out' ('err') as they come.
+        """
+        future = Future()
+        with self._lock:
+            if not self.alive:
+                raise BrokenPipeError(f"Agent in '{self._container}' not running")
+            self._next += 1
+            job = self._next
+            self._jobs[job] = _Job(future, command, out, err)
+        self._send(START, job, json.dumps(self._shell + [command]).encode())
+        return future
+
+    def run(self, command:str, timeout:float=None, out=None, err=None) -> Result:
+        """
+        Run 'command' line, return its 'Result' (raise sh's error if it failed)
+
+        Raises 'concurrent.futures.TimeoutError' after 'timeout' seconds,
+        the command still running (see 'Shoosh.kill').
+        """
+        res = self.submit(command, out, err).result(timeout)
+        if res.exit_code:
+            raise _error(res)
+        return res
+
+    def close(self):
+        """
+        Stop the agent (closing its input), failing commands still running
+        """
+        self._closed = True
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        self._proc.wait()
+
+    def _hello(self):
+        head = _read_exact(self._proc.stdout, HEADER.size)
+        return head is not None and HEADER.unpack(head)[0] == HELLO
+
+    def _send(self, kind, job, data):
+        with self._write_lock:
+            self._proc.stdin.write(HEADER.pack(kind, job, len(data)) + data)
+            self._proc.stdin.flush()
+
+    def _read(self):
+        try:
+            self._read_frames()
+        except Exception as err:
+            log.error(f"Agent in '{self._container}' reader failed: {err}")
+        finally:
+            with self._lock:
+                self._reading = False
+                jobs, self._jobs = self._jobs, {}
+            if not self._closed:
+                log.error(f"Agent in '{self._container}' stopped")
+                self._proc.kill()
+            for job in jobs.values():
+                job.future.set_exception(BrokenPipeError(f"Agent stopped running: {job.command}"))
+
+    def _read_frames(self):
+        stream = self._proc.stdout
+        while True:
+            head = _read_exact(stream, HEADER.size)
+            if head is None:
+                return
+            kind, job, size = HEADER.unpack(head)
+            data = _read_exact(stream, size) if size else b''
+            if data is None:
+                return
+            with self._lock:
+                entry = self._jobs.get(job)
+            if entry is None:
+                continue
+            if kind in (OUT, ERR):
+                entry.feed(kind, data)
+            elif kind == EXIT:
+                with self._lock:
+                    del self._jobs[job]
+                entry.flush()
+                code = struct.unpack('>i', data)[0]
+                entry.future.set_result(Result(entry.command, code, b''.join(entry.output[OUT]),
+                                               b''.join(entry.output[ERR])))
+
+
+class _Job(object):
+    """
+    Command run by the agent: its Future, output so far and line callbacks
+
+    Output is given to callbacks by line, decoded once complete, so that
+    characters split between frames are decoded whole; lines that are not
+    valid text are given as bytes, as sh does. A callback raising an
+    exception is logged and not called again.
+    """
+    __slots__ = ('future', 'command', 'output', 'partial', 'callbacks')
+
+    def __init__(self, future, command, out, err):
+        self.future = future
+        self.command = command
+        self.output = {OUT: [], ERR: []}
+        self.partial = {OUT: b'', ERR: b''}
+        self.callbacks = {OUT: out, ERR: err}
+
+    def feed(self, kind, data):
+        self.output[kind].append(data)
+        if self.callbacks[kind] is None:
+            return
+        lines = (self.partial[kind] + data).split(b'\n')
+        self.partial[kind] = lines.pop()
+        for line in lines:
+            self._call(kind, line + b'\n')
+
+    def flush(self):
+        for kind, rest in self.partial.items():
+            if rest and self.callbacks[kind] is not None:
+                self._call(kind, rest)
+
+    def _call(self, kind, line):
+        try:
+            line = line.decode()
+        except UnicodeDecodeError:
+            pass
+        try:
+            self.callbacks[kind](line)
+        except Exception as err:
+            log.error(f"Output callback failed, no longer called: {err}")
+            self.callbacks[kind] = None
+
+
+def _read_exact(stream, size):
+    buf = stream.read(size)
+    return buf if len(buf) == size else None
+
+
+def _error(res):
+    """
+    Return sh's exception for (failed) 'res', as when run through sh
+    """
+    if res.exit_code < 0:
+        name = signal.Signals(-res.exit_code).name
+        return getattr(sh, f'SignalException_{name}')(res.command, res.stdout, res.stderr)
+    return getattr(sh, f'ErrorReturnCode_{res.exit_code}')(res.command, res.stdout, res.stderr)
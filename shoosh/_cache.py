@@ -0,0 +1,91 @@
+"""
+On-disk cache of containers details (inspect)
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from . import _log as log
+
+MAX_ENTRIES = 256
+
+
+def directory() -> str:
+    """
+    Return the cache directory (under XDG_CACHE_HOME, or ~/.cache)
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'shoosh', 'containers')
+
+
+def load(container:str, host:str=None) -> dict:
+    """
+    Return cached details of 'container', None if not cached
+
+    Details are those of 'docker.inspect_many', as they were when stored:
+    they are not checked against the docker daemon (that is the call the
+    cache saves). Entries are keyed by container name (and host); handles
+    created from them reach the container by ID only -- commands, pipelines,
+    agent, staging -- so that if the container was recreated since, none runs
+    in the new one with the former mounts: a command fails, the details are
+    inspected again and the command mapped and run again (see
+    'Shoosh.__call__'); pipeline stages fail.
+    """
+    try:
+        with open(_filename(container, host)) as fp:
+            entry = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    info = entry.get('info') or {}
+    if not info.get('id') or entry.get('container') != container:
+        return None
+    return info
+
+
+def store(container:str, info:dict, host:str=None):
+    """
+    Write details 'info' of 'container' in cache
+    """
+    path = _filename(container, host)
+    folder = os.path.dirname(path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        # write aside and rename, concurrent writers do not corrupt entries
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(dict(container=container, host=host, info=info), fp)
+        os.replace(tmp, path)
+        _prune(folder)
+    except OSError as err:
+        log.warning(f"Could not cache container '{container}': {err}")
+
+
+def invalidate(container:str, host:str=None):
+    """
+    Remove 'container' from cache
+    """
+    try:
+        os.remove(_filename(container, host))
+    except OSError:
+        pass
+
+
+def _filename(container, host):
+    name = hashlib.sha1(f'{host or ""}/{container}'.encode()).hexdigest()[:20]
+    return os.path.join(directory(), f'{name}.json')
+
+
+def _prune(folder, max_entries=MAX_ENTRIES):
+    """
+    Remove least recently written entries above 'max_entries'
+    """
+    entries = [ e for e in os.scandir(folder) if e.name.endswith('.json') ]
+    if len(entries) <= max_entries:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_entries]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,59 @@
+"""
+Command-line interface: 'shoosh daemon', 'shoosh run', 'shoosh containers'
+"""
+import argparse
+import signal
+import sys
+
+from . import _log as log
+from ._daemon import Client, Daemon
+
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(prog='shoosh',
+        description='Run commands in docker containers mapping (host) paths.')
+    parser.add_argument('--socket', default=None,
+                        help='Daemon unix socket (default in $XDG_RUNTIME_DIR or /tmp)')
+    sub = parser.add_subparsers(dest='action')
+    sub.required = True
+
+    daemon = sub.add_parser('daemon', help='Serve warm container handles')
+    daemon.add_argument('containers', nargs='*', help='Containers to initialize')
+    daemon.add_argument('--timeout', type=float, default=None,
+                        help='Default timeout (seconds) of commands')
+    daemon.add_argument('--log-level', default='INFO')
+
+    run = sub.add_parser('run', help='Run command through the daemon')
+    run.add_argument('--timeout', type=float, default=None)
+    run.add_argument('container')
+    run.add_argument('exec')
+    run.add_argument('args', nargs=argparse.REMAINDER)
+
+    sub.add_parser('containers', help='List containers warm in the daemon')
+
+    args = parser.parse_args(argv)
+
+    if args.action == 'daemon':
+        log.set_stream(args.log_level)
+        # stop on TERM as on Ctrl-C, removing the socket
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        with Daemon(args.containers, socket=args.socket, timeout=args.timeout) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    client = Client(args.socket)
+    try:
+        if args.action == 'containers':
+            print('\n'.join(client.containers()))
+            return 0
+        return client.run(args.container, args.exec, *args.args, timeout=args.timeout)
+    except (ConnectionRefusedError, FileNotFoundError):
+        print("shoosh: daemon not running, start it with 'shoosh daemon'", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
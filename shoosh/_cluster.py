@@ -0,0 +1,117 @@
+"""
+Commands distributed across containers in several docker daemons (nodes)
+"""
+from . import _log as log
+from . import _docker as docker
+from ._sh import Shoosh
+from ._hedge import Replicas
+
+
+class Cluster(object):
+    """
+    Handles to the containers of several docker endpoints (nodes)
+
+    Containers and their volumes are discovered in each endpoint -- a
+    'DOCKER_HOST' like URL ('tcp://node1:2375', 'ssh://user@node2') or a unix
+    socket ('unix:///path/to/docker.sock', or just the path).
+
+    Nodes typically share a filesystem, mounted at different paths in each
+    node and in the host running shoosh. Per endpoint, 'paths' lists how
+    (local) host paths translate to the node paths, which are then mapped
+    to the containers' volumes:
+        paths = {'tcp://node1:2375': [('/mnt/shared', '/data/shared')]}
+    Endpoints not in 'paths' see the same paths as the local host.
+
+    Commands are run in the node with least commands in flight (see
+    'shoosh.Replicas').
+
+    Example:
+        cluster = Cluster(['unix:///run/node1.sock', 'unix:///run/node2.sock'])
+        gdalinfo = cluster.wrap('gdalinfo', container='gdal')
+        gdalinfo('/mnt/shared/raster.tif')
+    """
+    def __init__(self, endpoints:list, paths:dict=None):
+        self._endpoints = list(endpoints)
+        self._paths = paths or {}
+        self._nodes = {}
+        self._replicas = {}
+        self.discover()
+
+    @property
+    def nodes(self) -> dict:
+        """
+        Return containers (details) available per endpoint
+        """
+        return self._nodes
+
+    def discover(self):
+        """
+        (Re)discover containers and their volumes in every endpoint
+        """
+        self._replicas = {}
+        for host in self._endpoints:
+            names = docker.containers(host)
+            infos = docker.inspect_many(names, host) if names else {}
+            self._nodes[host] = { n: i for n,i in infos.items() if i['running'] }
+            log.debug(f"Endpoint '{host}': {list(self._nodes[host])}")
+
+    def handles(self, container:str) -> list:
+        """
+        Return (shoosh) handles to 'container' in every endpoint running it
+        """
+        handles = []
+        for host, infos in self._nodes.items():
+            info = infos.get(container)
+            if not info:
+                continue
+            sh = Shoosh(f'{container}@{host}')
+            maps = _node_mappings(info['mounts'], self._paths.get(host))
+            sh.set_docker(container, maps, info=info, host=host)
+            handles.append(sh)
+        if not handles:
+            log.error(f"Container '{container}' not running in any endpoint.")
+        return handles
+
+    def replicas(self, container:str, **kwargs) -> Replicas:
+        """
+        Return replicas group of 'container' across endpoints (see 'Replicas')
+        """
+        if container not in self._replicas:
+            self._replicas[container] = Replicas(self.handles(container), **kwargs)
+        return self._replicas[container]
+
+    def wrap(self, exec, container:str, **kwargs):
+        """
+        Return a callable running 'exec' in 'container' of the least loaded node
+        """
+        return self.replicas(container).wrap(exec, **kwargs)
+
+
+def _node_mappings(mounts:list, paths:list=None) -> list:
+    """
+    Return (local host, container) mappings of node 'mounts' through 'paths'
+
+    Input:
+        mounts: list
+            Node volumes, list of (node path, container path)
+        paths: list
+            Translation from local to node paths, list of (local path, node path)
+    """
+    if not paths:
+        return list(mounts)
+
+    def _under(path, prefix):
+        prefix = prefix.rstrip('/')
+        return path == prefix or path.startswith(prefix + '/')
+
+    maps = []
+    for src, dst in mounts:
+        for local, node in paths:
+            if _under(src, node):
+                # Volume inside the shared path
+                maps.append((local.rstrip('/') + src[len(node.rstrip('/')):], dst))
+            elif _under(node, src):
+                # Shared path inside the volume
+                maps.append((local, dst.rstrip('/') + node[len(src.rstrip('/')):]))
+    # most specific paths first
+    return sorted(maps, key=lambda m: len(m[0]), reverse=True)
@@ -0,0 +1,266 @@
+"""
+Local daemon holding warm handles, and its client
+
+The daemon listens on a unix socket; clients send one request (a JSON line)
+per connection and read back JSON lines: '{"out": ...}' ('{"err": ...}') for
+each output (error output) line of the command, then '{"exit": code}' (and
+"error", if it failed to run). Output that is not text (UTF-8) is sent
+base64 encoded, flagged with '"b64": true'.
+"""
+import base64
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import uuid
+from os.path import abspath, exists
+
+from sh import ErrorReturnCode, TimeoutException
+
+from . import _log as log
+
+# Exit code reported when the command timed out (like coreutils' timeout)
+TIMEOUT_EXIT = 124
+
+
+def default_socket() -> str:
+    """
+    Return the daemon socket path (in XDG_RUNTIME_DIR, or /tmp)
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'shoosh.sock')
+    return f'/tmp/shoosh-{os.getuid()}.sock'
+
+
+class Daemon(object):
+    """
+    Serve commands in warm handles of 'containers' through a unix 'socket'
+
+    Handles are initialized once (see 'shoosh.init'); containers requested
+    but not listed are initialized on first request. Clients send host
+    paths, mapped and run in the daemon, the output being streamed back
+    line by line. A command whose client goes away is terminated.
+
+    Example:
+        with Daemon(['gdal']) as daemon:
+            daemon.serve_forever()
+    """
+    def __init__(self, containers:list=(), socket:str=None, timeout:float=None):
+        from . import init
+        self._init = init
+        self._path = socket or default_socket()
+        self._timeout = timeout
+        self._handles = {}
+        self._lock = threading.Lock()
+        for container in containers:
+            self.handle(container)
+
+        if exists(self._path):
+            os.remove(self._path)
+        self._server = _Server(self._path, _Handler)
+        self._server.daemon = self
+        os.chmod(self._path, 0o600)
+        log.info(f"Daemon listening on '{self._path}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def socket(self) -> str:
+        return self._path
+
+    def handle(self, container:str):
+        """
+        Return (warm) handle to 'container', initialized if not yet
+        """
+        with self._lock:
+            if container not in self._handles:
+                self._handles[container] = self._init(container)
+            return self._handles[container]
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stop serving (from another thread than 'serve_forever')
+        """
+        self._server.shutdown()
+
+    def close(self):
+        self._server.server_close()
+        if exists(self._path):
+            os.remove(self._path)
+
+    def run(self, request:dict, send):
+        """
+        Run command of 'request', sending its output/exit frames with 'send'
+        """
+        try:
+            handle = self.handle(request['container'])
+        except Exception as err:
+            log.error(f"Container '{request.get('container')}' not available: {err}")
+            send(exit=1, error=f'container not available: {err}')
+            return
+
+        token = uuid.uuid4().hex
+        gone = threading.Event()
+        failed = []
+
+        def _forward(key, line):
+            if gone.is_set() or failed:
+                return
+            try:
+                if isinstance(line, bytes):
+                    send(**{key: base64.b64encode(line).decode(), 'b64': True})
+                else:
+                    send(**{key: line})
+            except OSError:
+                log.warning(f"Client gone, terminating command '{token}'")
+                gone.set()
+                threading.Thread(target=handle.kill, args=(token,), daemon=True).start()
+            except Exception as err:
+                # never let output be lost silently: the command is reported failed
+                log.error(f"Could not forward output of '{token}': {err}")
+                failed.append(str(err))
+
+        wrapped = handle.wrap(request['exec'])
+        kwargs = dict(request.get('kwargs') or {})
+        try:
+            wrapped(*request.get('args', ()), _token=token,
+                    _out=lambda line: _forward('out', line),
+                    _err=lambda line: _forward('err', line),
+                    _timeout=request.get('timeout') or self._timeout, **kwargs)
+            code, error = 0, None
+        except ErrorReturnCode as err:
+            code, error = err.exit_code, None
+        except TimeoutException:
+            code, error = TIMEOUT_EXIT, 'timed out'
+        except Exception as err:
+            log.error(f"Request failed: {err}")
+            code, error = 1, str(err)
+        if failed:
+            code, error = code or 1, f'output lost: {failed[0]}'
+        if not gone.is_set():
+            send(exit=code, error=error)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        lock = threading.Lock()
+
+        def send(**frame):
+            data = json.dumps({ k:v for k,v in frame.items() if v is not None })
+            with lock:
+                self.wfile.write(data.encode() + b'\n')
+                self.wfile.flush()
+
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            send(exit=1, error='invalid request')
+            return
+        op = request.get('op', 'run')
+        if op == 'run':
+            self.server.daemon.run(request, send)
+        elif op == 'containers':
+            send(containers=sorted(self.server.daemon._handles), exit=0)
+        else:
+            send(exit=1, error=f"unknown operation '{op}'")
+
+
+class Client(object):
+    """
+    Run commands through the local shoosh daemon (see 'Daemon')
+
+    Arguments being existing (local) paths are sent as absolute paths, so
+    that the daemon maps them whatever its working directory.
+
+    Example:
+        client = Client()
+        code = client.run('gdal', 'gdalinfo', 'raster.tif')
+    """
+    def __init__(self, socket:str=None):
+        self._path = socket or default_socket()
+
+    def run(self, container:str, exec:str, *args, out=None, err=None,
+            timeout:float=None, **kwargs) -> int:
+        """
+        Run 'exec' with 'args/kwargs' in 'container', return its exit code
+
+        Output lines are given to 'out', error output lines to 'err' (default,
+        written to stdout and stderr), as strings -- or bytes, if not text.
+        """
+        out = out or _writer(sys.stdout)
+        err = err or _writer(sys.stderr)
+        request = dict(op='run', container=container, exec=exec,
+                       args=[ _absolute(a) for a in args ],
+                       kwargs={ k: _absolute(v) for k,v in kwargs.items() },
+                       timeout=timeout)
+        for frame in self._request(request):
+            if frame.get('b64'):
+                frame = { k: base64.b64decode(v) if k in ('out', 'err') else v
+                          for k,v in frame.items() }
+            if 'out' in frame:
+                out(frame['out'])
+            if 'err' in frame:
+                err(frame['err'])
+            if 'exit' in frame:
+                if frame.get('error'):
+                    log.error(f"Daemon: {frame['error']}")
+                return frame['exit']
+        log.error("Daemon closed connection before command finished")
+        return 1
+
+    def wrap(self, container:str, exec:str):
+        """
+        Return a callable running 'exec' in 'container' (see 'run')
+        """
+        def _run(*args, **kwargs):
+            return self.run(container, exec, *args, **kwargs)
+        return _run
+
+    def containers(self) -> list:
+        """
+        Return containers with warm handles in the daemon
+        """
+        for frame in self._request(dict(op='containers')):
+            return frame.get('containers', [])
+        return []
+
+    def _request(self, request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self._path)
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as frames:
+                for line in frames:
+                    yield json.loads(line)
+
+
+def _writer(stream):
+    """
+    Return function writing text or bytes to (text) 'stream', as bytes
+    """
+    def _write(data):
+        if isinstance(data, str):
+            data = data.encode()
+        stream.buffer.write(data)
+        stream.buffer.flush()
+    return _write
+
+
+def _absolute(value):
+    if isinstance(value, str) and exists(value):
+        return abspath(value)
+    return value
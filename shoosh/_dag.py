@@ -0,0 +1,226 @@
+"""
+Workflows of commands depending on each other's outputs (DAG)
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os.path import abspath
+
+from . import _log as log
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Task(object):
+    """
+    A command of a workflow, with its (host) input and output paths
+    """
+    def __init__(self, name, command, args, kwargs, inputs, outputs):
+        self.name = name
+        self.command = command
+        self.args = args
+        self.kwargs = kwargs
+        self.inputs = [ abspath(p) for p in inputs ]
+        self.outputs = [ abspath(p) for p in outputs ]
+        self.deps = set()
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.start = None
+        self.end = None
+
+    def __repr__(self):
+        return f"Task('{self.name}', {self.status})"
+
+    @property
+    def duration(self) -> float:
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
+
+class Workflow(object):
+    """
+    Run commands in order of their dependencies, independent ones concurrently
+
+    Tasks declare the host paths they read ('inputs') and write ('outputs');
+    a task depends on the tasks writing any of its inputs (or directories
+    containing them). Commands are wrapped commands (see 'Shoosh.wrap'), or
+    command names wrapped in one of 'handles' -- the one running the least
+    tasks -- when the task starts.
+
+    At most 'max_workers' tasks run at once. If a task fails, 'on_error'
+    decides whether to 'stop' starting new tasks or to 'continue' with those
+    not depending on the failed one.
+
+    Example:
+        wf = Workflow(handles=[shoosh.init('gdal')])
+        wf.add('gdal_translate', '/data/in.tif', '/data/out.tif',
+               inputs=['/data/in.tif'], outputs=['/data/out.tif'])
+        wf.add('gdaladdo', '/data/out.tif', inputs=['/data/out.tif'])
+        report = wf.run()
+    """
+    def __init__(self, handles:list=None, max_workers:int=4, on_error:str='stop'):
+        assert on_error in ('stop', 'continue')
+        self._handles = list(handles or [])
+        self._load = [0] * len(self._handles)
+        self._max_workers = max_workers
+        self._on_error = on_error
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tasks(self) -> dict:
+        return self._tasks
+
+    def add(self, command, *args, inputs=(), outputs=(), name:str=None, **kwargs) -> Task:
+        """
+        Add task running 'command' with arguments 'args/kwargs'
+
+        Input:
+            command: str or callable
+                Command name (wrapped in one of the workflow handles), or a
+                wrapped command
+            inputs, outputs: list
+                Host paths read/written by the command
+            name: str
+                Name of the task (default is command name and a counter)
+        """
+        if name is None:
+            label = command if isinstance(command, str) else getattr(command, '__name__', 'task')
+            name = f'{label}-{len(self._tasks)}'
+        if name in self._tasks:
+            raise ValueError(f"Task '{name}' already in workflow")
+        if isinstance(command, str) and not self._handles:
+            raise ValueError("Command names require workflow 'handles'")
+        task = Task(name, command, args, kwargs, inputs, outputs)
+        self._tasks[name] = task
+        return task
+
+    def run(self) -> dict:
+        """
+        Run all tasks, return report with tasks status/timing and critical path
+
+        Report:
+            tasks: {name: {status, start, end, duration, error}}
+            wall_time: seconds from first task start to last task end
+            critical_path: names of the (longest) chain of dependent tasks
+            critical_time: sum of durations of the critical path tasks
+        """
+        self._link()
+        order = self._toposort()
+        start = time.monotonic()
+
+        running = {}
+        stop = False
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            while True:
+                for task in order:
+                    if task.status != PENDING:
+                        continue
+                    deps = [ self._tasks[d].status for d in task.deps ]
+                    if any(s in (FAILED, SKIPPED) for s in deps):
+                        task.status = SKIPPED
+                        log.warning(f"Task '{task.name}' skipped")
+                    elif not stop and all(s == DONE for s in deps):
+                        task.status = RUNNING
+                        running[pool.submit(self._execute, task)] = task
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    task = running.pop(fut)
+                    if task.status == FAILED and self._on_error == 'stop':
+                        stop = True
+
+        for task in order:
+            if task.status == PENDING:
+                task.status = SKIPPED
+        return self._report(order, start)
+
+    def _execute(self, task):
+        command = task.command
+        index = None
+        if isinstance(command, str):
+            with self._lock:
+                index = self._load.index(min(self._load))
+                self._load[index] += 1
+            command = self._handles[index].wrap(command)
+        task.start = time.monotonic()
+        try:
+            task.result = command(*task.args, **task.kwargs)
+            task.status = DONE
+        except Exception as err:
+            log.error(f"Task '{task.name}' failed: {err}")
+            task.error = err
+            task.status = FAILED
+        finally:
+            task.end = time.monotonic()
+            if index is not None:
+                with self._lock:
+                    self._load[index] -= 1
+
+    def _link(self):
+        """
+        Set task dependencies from their inputs and outputs
+        """
+        def _under(path, prefix):
+            return path == prefix or path.startswith(prefix.rstrip('/') + '/')
+
+        writers = [ (p, t) for t in self._tasks.values() for p in t.outputs ]
+        for task in self._tasks.values():
+            task.deps = { w.name for p,w in writers
+                          if w is not task
+                          and any(_under(i, p) or _under(p, i) for i in task.inputs) }
+
+    def _toposort(self):
+        order = []
+        marks = {}
+
+        def _visit(task, path):
+            if marks.get(task.name) == DONE:
+                return
+            if marks.get(task.name) == RUNNING:
+                cycle = ' -> '.join(path + [task.name])
+                raise ValueError(f"Workflow has a cycle: {cycle}")
+            marks[task.name] = RUNNING
+            for dep in sorted(task.deps):
+                _visit(self._tasks[dep], path + [task.name])
+            marks[task.name] = DONE
+            order.append(task)
+
+        for task in self._tasks.values():
+            _visit(task, [])
+        return order
+
+    def _report(self, order, start):
+        finish = {}
+        previous = {}
+        for task in order:
+            deps = [ d for d in task.deps if d in finish ]
+            before = max(deps, key=finish.get, default=None)
+            previous[task.name] = before
+            finish[task.name] = (finish[before] if before else 0) + (task.duration or 0)
+
+        path = []
+        last = max(finish, key=finish.get, default=None)
+        while last:
+            path.insert(0, last)
+            last = previous[last]
+
+        ends = [ t.end for t in order if t.end is not None ]
+        return dict(
+            tasks = { t.name: dict(status = t.status,
+                                   start = t.start and t.start - start,
+                                   end = t.end and t.end - start,
+                                   duration = t.duration,
+                                   error = t.error)
+                      for t in order },
+            wall_time = (max(ends) - start) if ends else 0,
+            critical_path = path,
+            critical_time = finish[path[-1]] if path else 0,
+        )
@@ -1,14 +1,94 @@
 """
 Docker handlers
 """
+import asyncio
+import copy
+import functools
 import json
+import shutil
 from io import StringIO
 from sh import docker
 from . import _log as log
+from ._flight import SingleFlight
 
 SHELL_COMMAND="bash --login -c"
 
-def containers() -> list:
+# Directory (in container) where commands' PID files are written
+PID_DIR = '/tmp'
+
+# Signal (TERM) the process tree whose root PID is in file "$1", wait "$2"
+# seconds for them to finish, then KILL the remaining ones.
+_KILL_TREE = r"""
+[ -f "$1" ] || sleep 1
+pid=$(cat "$1" 2>/dev/null) || exit 0
+tree() {
+    for c in $(cat /proc/$1/task/*/children 2>/dev/null); do tree $c; done
+    echo $1
+}
+pids=$(tree $pid)
+kill -TERM $pids 2>/dev/null
+i=0
+while :; do
+    alive=
+    for p in $pids; do kill -0 $p 2>/dev/null && alive="$alive $p"; done
+    [ -z "$alive" ] || [ $i -ge $2 ] && break
+    sleep 1; i=$((i+1))
+done
+[ -n "$alive" ] && kill -KILL $alive 2>/dev/null
+rm -f "$1"
+exit 0
+"""
+
+_flights = SingleFlight()
+
+
+def _coalesce(func):
+    """
+    Decorate 'func' so that concurrent identical calls share one execution
+
+    While a call is in flight, callers with the same arguments wait for
+    (a copy of) its result instead of querying the docker daemon again.
+    """
+    @functools.wraps(func)
+    def _func(*args, **kwargs):
+        key = (func.__name__, _hashable(args), _hashable(kwargs))
+        return copy.deepcopy(_flights.run(key, func, *args, **kwargs))
+
+    async def _async(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(_func, *args, **kwargs))
+
+    _async.__doc__ = f"Asyncio version of '{func.__name__}'"
+    _func.aio = _async
+    return _func
+
+
+def _hashable(obj):
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _hashable(v)) for k,v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(_hashable(v) for v in obj)
+    return obj
+
+
+def client(host:str=None):
+    """
+    Return 'docker' command for daemon at 'host' (eg, 'unix:///path/to/sock')
+
+    If 'host' is None, the default daemon (eg, 'DOCKER_HOST') is used.
+    A path (eg, '/path/to/sock') is taken as a unix socket.
+    """
+    if not host:
+        return docker
+    return docker.bake('-H', _host_url(host))
+
+
+def _host_url(host):
+    return host if '://' in host else f'unix://{host}'
+
+
+@_coalesce
+def containers(host:str=None) -> list:
     """
     Return list of container (names) instanciated
     """
@@ -17,7 +97,7 @@ def containers() -> list:
 
     _exec(tail,
         _exec(awk,
-            _exec(docker, 'ps','-a'),
+            _exec(client(host), 'ps','-a'),
         '{print $NF}'),
     '-n+2', _out=buf)
 
@@ -25,16 +105,18 @@ def containers() -> list:
     return containers
 
 list_containers = containers
+containers_async = containers.aio
 
 
-def volumes(container:str) -> list:
+@_coalesce
+def volumes(container:str, host:str=None) -> list:
     """
     Return list of 'container' volumes (host,cont)
     """
     buf = StringIO()
 
     _exec(
-        docker, 'inspect', '-f', "'{{json .Mounts}}'", container, _out=buf
+        client(host), 'inspect', '-f', "'{{json .Mounts}}'", container, _out=buf
     )
 
     res = buf.getvalue().strip()
@@ -45,20 +127,171 @@ def volumes(container:str) -> list:
     return vols
 
 list_volumes = volumes
+volumes_async = volumes.aio
+
+
+@_coalesce
+def inspect_many(containers:list, host:str=None) -> dict:
+    """
+    Return dictionary of 'containers' (names or IDs) and their details
+
+    All containers are inspected in one call to the docker daemon.
+    Containers not found are not present in the output, for each container
+    found, the following details (dict) are returned:
+        id: full container ID
+        created: container creation time
+        name: container name
+        image: image ID
+        state: container status (eg, 'running', 'exited')
+        running: True if container is running (neither paused nor restarting)
+        mounts: list of volumes (host,cont)
+        readonly: list of container paths of read-only volumes
+        env: dictionary of environment variables
+        cpus: number of CPUs available to the container (None if not limited)
+
+    Concurrent calls for the same containers share one query to the daemon;
+    'inspect_many.aio' is the asyncio version.
+    """
+    if not containers:
+        return {}
+    buf = StringIO()
+
+    # 'inspect' returns 1 if some of the containers are not found,
+    # the ones found are output nevertheless.
+    res = _exec(client(host), 'inspect', *containers, _out=buf, _ok_code=[0,1])
+    if res is None:
+        return {}
+
+    found = [ _details(d) for d in json.loads(buf.getvalue() or '[]') ]
+
+    infos = {}
+    for c in containers:
+        for info in found:
+            if c == info['name'] or info['id'].startswith(c):
+                infos[c] = info
+                break
+        else:
+            log.error(f"Container '{c}' not found.")
+    return infos
+
+inspect_many_async = inspect_many.aio
+
+
+def _details(obj:dict) -> dict:
+    """
+    Return relevant details from 'docker inspect' container object
+    """
+    state = obj.get('State') or {}
+    env = (obj.get('Config') or {}).get('Env') or []
+    host = obj.get('HostConfig') or {}
+    cpus = None
+    if host.get('NanoCpus'):
+        cpus = host['NanoCpus'] / 1e9
+    elif host.get('CpuQuota', 0) > 0 and host.get('CpuPeriod'):
+        cpus = host['CpuQuota'] / host['CpuPeriod']
+    elif host.get('CpusetCpus'):
+        cpus = len(parse_cpuset(host['CpusetCpus']))
+    return dict(
+        id = obj['Id'],
+        created = obj.get('Created'),
+        name = obj['Name'].lstrip('/'),
+        image = obj.get('Image'),
+        state = state.get('Status'),
+        running = bool(state.get('Running')
+                        and not state.get('Paused')
+                        and not state.get('Restarting')),
+        mounts = [ (d['Source'],d['Destination']) for d in obj.get('Mounts') or [] ],
+        readonly = [ d['Destination'] for d in obj.get('Mounts') or [] if d.get('RW') is False ],
+        env = dict(e.split('=',1) for e in env if '=' in e),
+        cpus = cpus,
+    )
+
+
+def parse_cpuset(cpuset:str) -> list:
+    """
+    Return list of CPUs in 'cpuset' string (eg, "0-3,6" -> [0,1,2,3,6])
+    """
+    cpus = []
+    for part in cpuset.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def cpu_usage(containers:list, host:str=None) -> dict:
+    """
+    Return CPU usage of 'containers' (at docker 'host'), 1.0 is one CPU fully used
+
+    All containers are queried in one call ('docker stats').
+    """
+    buf = StringIO()
+    res = _exec(client(host), 'stats', '--no-stream', '--format', '{{json .}}',
+                *containers, _out=buf)
+    if res is None:
+        return {}
+    usage = {}
+    for line in buf.getvalue().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        obj = json.loads(line)
+        name = obj.get('Name') or obj.get('Container')
+        usage[name] = float(obj['CPUPerc'].rstrip('%') or 0) / 100
+    return usage
+
+
+def cpu_throttling(container:str, host:str=None) -> int:
+    """
+    Return the number of periods 'container' (at docker 'host') CPU was
+    throttled (cgroup cpu.stat)
+    """
+    buf = StringIO()
+    res = _exec(client(host), 'exec', container, 'sh', '-c',
+                'cat /sys/fs/cgroup/cpu.stat || cat /sys/fs/cgroup/cpu/cpu.stat',
+                _out=buf)
+    if res is None:
+        return None
+    for line in buf.getvalue().splitlines():
+        key, _, value = line.partition(' ')
+        if key == 'nr_throttled':
+            return int(value)
+    return None
 
 
-def bake(container):
+def bake(container, check:bool=True, host:str=None, tty:bool=False):
     """
     Return a 'sh' instance running inside 'container'
+
+    If 'check', verify 'container' is available before.
+    Unless 'tty', commands run without a terminal: stdout and stderr are
+    kept apart, as bytes (decoded only when the result is used as text),
+    and binary output is not altered.
     """
-    exec_ = "exec -t {container!s} " + SHELL_COMMAND
+    exec_ = "exec {tty}{container!s} " + SHELL_COMMAND
 
-    if container not in containers():
+    if check and container not in containers(host):
         log.error(f"Container '{container}' not available.")
         return None
 
-    sh_ = docker.bake(exec_.format(container=container).split())
-    return sh_
+    exec_ = exec_.format(tty='-t ' if tty else '', container=container)
+    if tty:
+        return client(host).bake(exec_.split())
+    return client(host).bake(exec_.split(), _tty_out=False)
+
+
+def exec_argv(container:str, host:str=None) -> list:
+    """
+    Return argv of a shell in 'container', taking the command line as last argument
+
+    Standard input/output are attached as is (no tty), for commands whose
+    processes are connected to each other's (see 'shoosh._pipe').
+    """
+    argv = [shutil.which('docker') or 'docker']
+    if host:
+        argv += ['-H', _host_url(host)]
+    return argv + ['exec', '-i', container] + SHELL_COMMAND.split()
 
 
 def run(image:str, name:str, volumes:list=None, ports:list=None) -> bool:
@@ -82,9 +315,8 @@ def run(image:str, name:str, volumes:list=None, ports:list=None) -> bool:
         pass
 
     maps = []
-    if volumes:
-        vols = [ f'{h},{c}' for h,c in volumes ]
-        maps = ['-v'] + vols
+    for h,c in (volumes or []):
+        maps += ['-v', f'{h}:{c}']
 
     return _exec(docker, 'run', '-dt', '--name', name, *maps, image)
 
@@ -100,6 +332,53 @@ def start(container:str) -> bool:
     return _exec(docker, 'start', container)
 
 
+def stop(container:str):
+    """
+    Stop a running container
+    """
+    return _exec(docker, 'stop', container)
+
+
+def remove(container:str, force:bool=False):
+    """
+    Remove a container
+    """
+    opts = ['-f'] if force else []
+    return _exec(docker, 'rm', *opts, container)
+
+
+def execute(container:str, *args, host:str=None, **kwargs):
+    """
+    Run command 'args' in 'container' directly (no shell, no checks)
+    """
+    return _exec(client(host), 'exec', container, *args, **kwargs)
+
+
+def kill_tree(container:str, pidfile:str, grace:int=5, host:str=None):
+    """
+    Terminate process tree in 'container' whose root PID is in 'pidfile'
+
+    Processes are sent a TERM signal, those still alive after 'grace' seconds
+    are killed (KILL).
+    """
+    return _exec(client(host), 'exec', container,
+                 'sh', '-c', _KILL_TREE, 'shoosh-kill', pidfile, str(int(grace)))
+
+
+def copy_to(container:str, archive, path:str, host:str=None):
+    """
+    Extract tar stream 'archive' (file-like) into 'container' directory 'path'
+    """
+    return _exec(client(host), 'cp', '-', f'{container}:{path}', _in=archive)
+
+
+def copy_from(container:str, path:str, dest:str, host:str=None):
+    """
+    Copy 'path' from 'container' to host path 'dest'
+    """
+    return _exec(client(host), 'cp', f'{container}:{path}', dest)
+
+
 def _exec(foo, *args, **kwargs):
     try:
         return foo(*args, **kwargs)
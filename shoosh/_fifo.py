@@ -0,0 +1,180 @@
+"""
+Named pipes (FIFO) in mapped volumes, to stream data to/from commands
+"""
+import errno
+import fcntl
+import os
+import select
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from . import _log as log
+
+# Seconds between checks of the command while opening the FIFO
+POLL_INTERVAL = 0.05
+
+
+class Fifo(object):
+    """
+    Named pipe in a volume of 'handle', data channel between host and command
+
+    The FIFO is created in a mapped (writable) directory, so data written by
+    one side is read by the other through the kernel, neither the exec stream
+    nor the docker daemon in between. With 'mode' "r" the host reads what the
+    command writes, with "w" the host writes what the command reads.
+
+    The command -- given the FIFO host 'path' as argument, mapped as any
+    other path -- runs in background ('start'), while the host opens its side
+    ('open'). Opening does not block on a command that failed, or never opens
+    its side; the FIFO is removed when closed.
+
+    Example:
+        with sh.fifo('r') as out:
+            out.start(gdal_translate, '-of', 'GTiff', 'in.vrt', out.path)
+            data = out.read()
+    """
+    def __init__(self, handle, mode:str='r'):
+        assert mode in ('r', 'w'), "Mode is either 'r' (host reads) or 'w' (host writes)"
+        folder = handle._output_volume()
+        if folder is None:
+            raise RuntimeError("No writable volume to create FIFO in.")
+        name = f'.shoosh-fifo-{uuid.uuid4().hex}'
+        self._handle = handle
+        self._mode = mode
+        self._path = os.path.join(folder[0], name)
+        self._container_path = os.path.join(folder[1], name)
+        self._file = None
+        self._future = None
+        self._token = None
+        os.mkfifo(self._path)
+        # the command may run as a different user in the container
+        os.chmod(self._path, 0o666)
+        log.debug(f"FIFO '{self._path}' ({mode})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None and self._running():
+            self._handle.kill(self._token)
+        self.close(wait=exc_type is None)
+
+    @property
+    def path(self) -> str:
+        """
+        Return the FIFO path in the host (argument to commands)
+        """
+        return self._path
+
+    @property
+    def container_path(self) -> str:
+        return self._container_path
+
+    def start(self, wrapped, *args, **kwargs) -> Future:
+        """
+        Run 'wrapped' command with 'args/kwargs' in background
+
+        Output:
+            Future of the command result
+        """
+        self._token = kwargs.setdefault('_token', uuid.uuid4().hex)
+        self._future = Future()
+
+        def _run():
+            try:
+                self._future.set_result(wrapped(*args, **kwargs))
+            except BaseException as err:
+                self._future.set_exception(err)
+
+        threading.Thread(target=_run, daemon=True).start()
+        return self._future
+
+    def open(self, timeout:float=None):
+        """
+        Open (host side of) the FIFO, once the command opened its side
+
+        Raises the command exception if it finished before opening its side,
+        'TimeoutError' if it did not within 'timeout' seconds.
+        """
+        if self._file is not None:
+            return self._file
+        deadline = timeout and time.monotonic() + timeout
+        if self._mode == 'r':
+            # does not block; readable (or hung up) once a writer opened it
+            fd = os.open(self._path, os.O_RDONLY | os.O_NONBLOCK)
+            try:
+                poll = select.poll()
+                poll.register(fd, select.POLLIN | select.POLLHUP)
+                while not poll.poll(POLL_INTERVAL * 1000):
+                    self._check(deadline)
+            except BaseException:
+                os.close(fd)
+                raise
+        else:
+            while True:
+                try:
+                    # fails (ENXIO) until a reader opened it
+                    fd = os.open(self._path, os.O_WRONLY | os.O_NONBLOCK)
+                    break
+                except OSError as err:
+                    if err.errno != errno.ENXIO:
+                        raise
+                self._check(deadline)
+                time.sleep(POLL_INTERVAL)
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+        self._file = os.fdopen(fd, self._mode + 'b')
+        return self._file
+
+    def read(self, size:int=-1) -> bytes:
+        return self.open().read(size)
+
+    def write(self, data:bytes) -> int:
+        return self.open().write(data)
+
+    def __iter__(self):
+        return iter(self.open())
+
+    def close(self, wait:bool=True):
+        """
+        Close the FIFO, wait for the command (if 'wait') and remove the FIFO
+
+        Output:
+            Result of the command, if started
+        """
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            elif self._running():
+                self._release()
+            if self._future is not None and wait:
+                return self._future.result()
+        finally:
+            if os.path.exists(self._path):
+                os.remove(self._path)
+
+    def _running(self):
+        return self._future is not None and not self._future.done()
+
+    def _check(self, deadline):
+        if self._future is not None and self._future.done():
+            # raises the command error, if any
+            self._future.result()
+            raise BrokenPipeError(f"Command finished without opening '{self._path}'")
+        if deadline and time.monotonic() > deadline:
+            raise TimeoutError(f"FIFO '{self._path}' not opened by command")
+
+    def _release(self):
+        """
+        Open and close the host side, so the command does not block opening its own
+        """
+        mode = os.O_RDONLY if self._mode == 'r' else os.O_WRONLY
+        while self._running():
+            try:
+                os.close(os.open(self._path, mode | os.O_NONBLOCK))
+            except OSError:
+                pass
+            time.sleep(POLL_INTERVAL)
@@ -0,0 +1,43 @@
+"""
+Sharing of one execution between concurrent identical calls
+"""
+import threading
+from concurrent.futures import Future
+
+from . import _log as log
+
+
+class SingleFlight(object):
+    """
+    Calls in flight, by key: the first one runs, the others wait its outcome
+    """
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func, *args, **kwargs):
+        """
+        Run 'func(*args, **kwargs)', or wait for the one running for 'key'
+
+        Callers waiting get the result (or exception) of the running call.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            log.debug(f"Waiting in-flight call: {key}")
+            return future.result()
+
+        try:
+            res = func(*args, **kwargs)
+        except BaseException as err:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            del self._inflight[key]
+        future.set_result(res)
+        return res
@@ -0,0 +1,185 @@
+"""
+Filesystem queries in containers, many paths answered by one exec
+"""
+import shlex
+import stat as _stat
+
+from . import _log as log
+from ._pack import _limit
+from ._sh import _map_path
+
+# Printed before the answers, anything before it (login shell) is ignored
+MARKER = b'\0SHOOSH-FS\0'
+
+# Separator of the answers to each path
+END = '\1'
+
+_EXISTS = """for p in {paths}; do [ -e "$p" ] && printf '1\\0' || printf '0\\0'; done"""
+
+_STAT = """for p in {paths}; do
+    s=$(stat -c '%s %Y %f' -- "$p" 2>/dev/null); printf '%s\\0' "$s"
+done"""
+
+_GLOB = """shopt -s nullglob; IFS=
+for p in {paths}; do for f in $p; do printf '%s\\0' "$f"; done; printf '\\1\\0'; done"""
+
+_LISTDIR = """shopt -s nullglob dotglob
+for p in {paths}; do
+    [ -d "$p" ] || {{ printf '\\2\\0\\1\\0'; continue; }}
+    for f in "$p"/*; do printf '%s\\0' "${{f##*/}}"; done; printf '\\1\\0'
+done"""
+
+_WALK = """[ -d {paths} ] || exit 0
+find {paths} \\( -type d -exec printf 'd%s\\0' {{}} + \\) \\
+    -o -exec printf 'f%s\\0' {{}} + 2>/dev/null || true"""
+
+
+def exists(handle, paths):
+    """
+    Return whether 'paths' exist in the container of 'handle'
+    """
+    paths, single = _paths(paths)
+    out = _query(handle, _EXISTS, paths)
+    res = [ v == '1' for v in out ]
+    return res[0] if single else res
+
+
+def stat(handle, paths):
+    """
+    Return size, modification time and mode of 'paths', None if not found
+
+    Each result is a dictionary: 'size' (bytes), 'mtime' (seconds since
+    epoch), 'mode' (int, see 'stat' module), 'is_dir' and 'is_file'.
+    """
+    paths, single = _paths(paths)
+    out = _query(handle, _STAT, paths)
+    res = []
+    for value in out:
+        if not value:
+            res.append(None)
+            continue
+        size, mtime, mode = value.split()
+        mode = int(mode, 16)
+        res.append(dict(size = int(size),
+                        mtime = int(mtime),
+                        mode = mode,
+                        is_dir = _stat.S_ISDIR(mode),
+                        is_file = _stat.S_ISREG(mode)))
+    return res[0] if single else res
+
+
+def glob(handle, patterns):
+    """
+    Return (host) paths matching each of (host) 'patterns' in the container
+    """
+    patterns, single = _paths(patterns)
+    maps = _tuple_maps(handle)
+    res = [ [ _map_path(p, maps, reverse=True) for p in group ]
+            for group in _groups(_query(handle, _GLOB, patterns)) ]
+    return res[0] if single else res
+
+
+def listdir(handle, paths):
+    """
+    Return names of the entries in directories 'paths', None if not a directory
+    """
+    paths, single = _paths(paths)
+    res = [ None if group == ['\2'] else sorted(group)
+            for group in _groups(_query(handle, _LISTDIR, paths)) ]
+    return res[0] if single else res
+
+
+def walk(handle, path:str) -> list:
+    """
+    Return the tree under 'path' as 'os.walk' does, top-down, in one exec
+
+    Output:
+        List of (directory, directory names, file names); directories are
+        (host) paths
+    """
+    maps = _tuple_maps(handle)
+    top = _map_path(path, maps).rstrip('/') or '/'
+    tree = {}
+    for entry in _query(handle, _WALK, [top]):
+        kind, name = entry[0], entry[1:].rstrip('/') or '/'
+        if kind == 'd':
+            tree.setdefault(name, ([], []))
+        if name != top:
+            parent, _, base = name.rpartition('/')
+            tree.setdefault(parent or '/', ([], []))[0 if kind == 'd' else 1].append(base)
+    return [ (_map_path(d, maps, reverse=True), sorted(dirs), sorted(files))
+             for d, (dirs, files) in sorted(tree.items(), key=lambda i: (i[0].count('/'), i[0])) ]
+
+
+def _query(handle, script, paths):
+    """
+    Run 'script' for (host) 'paths' mapped in container, return its answers
+
+    Paths are split in as few execs as fit the command line limit (see
+    '_pack._limit'), answers are returned in order.
+    """
+    limit = _limit(handle)
+    answers = []
+    for batch in _batches(handle, script, paths, limit):
+        def _line(batch=batch):
+            maps = _tuple_maps(handle)
+            quoted = ' '.join(shlex.quote(_map_path(p, maps)) for p in batch)
+            return "printf '\\0SHOOSH-FS\\0'; " + script.format(paths=quoted)
+
+        res = handle(_line(), remap=_line)
+        out = res.stdout if isinstance(res.stdout, bytes) else str(res).encode()
+        if MARKER not in out:
+            log.error(f"Unexpected filesystem query output: {out[:100]}")
+            return []
+        out = out.rsplit(MARKER, 1)[1]
+        answers += [ v.decode(errors='surrogateescape') for v in out.split(b'\0')[:-1] ]
+    return answers
+
+
+def _batches(handle, script, paths, limit):
+    """
+    Split 'paths' in batches whose command line is at most 'limit' bytes
+    """
+    maps = _tuple_maps(handle)
+    count = script.count('{paths}')
+    base = len(script.encode()) + len(MARKER) + 32
+    batch = []
+    size = base
+    for path in paths:
+        length = (len(shlex.quote(_map_path(path, maps)).encode()) + 1) * count
+        if batch and size + length > limit:
+            yield batch
+            batch = []
+            size = base
+        if size + length > limit:
+            raise ValueError(f"Path longer than command line limit: {path}")
+        batch.append(path)
+        size += length
+    if batch:
+        yield batch
+
+
+def _groups(values):
+    """
+    Split 'values' in groups ended by 'END'
+    """
+    groups = []
+    group = []
+    for value in values:
+        if value == END:
+            groups.append(group)
+            group = []
+        else:
+            group.append(value)
+    return groups
+
+
+def _paths(paths):
+    if isinstance(paths, str):
+        return [paths], True
+    return list(paths), False
+
+
+def _tuple_maps(handle):
+    return (handle.mappings or {}).get(tuple) or ()
+
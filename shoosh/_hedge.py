@@ -0,0 +1,165 @@
+"""
+Hedged execution of commands across replica containers
+"""
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+from . import _log as log
+
+
+class Latency(object):
+    """
+    Latencies (seconds) of the last 'size' runs of a command
+    """
+    def __init__(self, size:int=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds:float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q:float) -> float:
+        """
+        Return the 'q' (0-1) percentile of latencies (None if no samples)
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def asdict(self) -> dict:
+        return dict(count = len(self),
+                    p50 = self.percentile(0.5),
+                    p95 = self.percentile(0.95),
+                    p99 = self.percentile(0.99))
+
+
+class Replicas(object):
+    """
+    Group of (shoosh) handles to equivalent containers, run commands in any
+
+    Each call runs in the replica with the least commands in flight.
+    Commands wrapped with 'hedge=True' -- which must be idempotent -- are
+    duplicated to another replica when running longer than the 'percentile'
+    of their (last 'history') latencies: the first one to finish wins, the
+    other is killed in its container. Hedging starts once a command has
+    'min_samples' latencies recorded.
+
+    Example:
+        group = Replicas([shoosh.init('gdal1'), shoosh.init('gdal2')])
+        gdalinfo = group.wrap('gdalinfo', hedge=True)
+        gdalinfo('/data/raster.tif')
+    """
+    def __init__(self, handles:list, percentile:float=0.95,
+                 min_samples:int=20, history:int=200):
+        assert len(handles) > 0
+        self._handles = list(handles)
+        self._percentile = percentile
+        self._min_samples = min_samples
+        self._history = history
+        self._inflight = [0] * len(self._handles)
+        self._latency = {}
+        self._hedged = 0
+        self._lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Return latency statistics per command and number of hedged calls
+        """
+        stats = { k: v.asdict() for k,v in self._latency.items() }
+        return dict(commands=stats, hedged=self._hedged)
+
+    def latency(self, name:str) -> Latency:
+        """
+        Return latencies of wrapped command 'name'
+        """
+        with self._lock:
+            if name not in self._latency:
+                self._latency[name] = Latency(self._history)
+            return self._latency[name]
+
+    def wrap(self, exec, hedge:bool=False, **kwargs):
+        """
+        Return a callable running 'exec' in the replicas (see 'Shoosh.wrap')
+
+        Input:
+            * exec : str
+                Command name to wrap (e.g, "echo")
+            * hedge : bool
+                If True, hedge slow calls in another replica ('exec' must be
+                idempotent)
+        """
+        name = exec if isinstance(exec, str) else ' '.join(exec)
+        wrapped = [ h.wrap(exec, **kwargs) for h in self._handles ]
+        latency = self.latency(name)
+
+        def _sh(*args, **kwargs):
+            """
+            Run 'exec' in the least loaded replica, hedging it if slow
+            """
+            first = self._pick()
+            start = time.monotonic()
+            calls = [ self._submit(wrapped, first, args, kwargs) ]
+
+            delay = None
+            if hedge and len(self._handles) > 1 and len(latency) >= self._min_samples:
+                delay = latency.percentile(self._percentile)
+            done, _ = wait([calls[0][0]], timeout=delay)
+            if not done:
+                second = self._pick(exclude=first)
+                log.debug(f"Hedging '{name}' (> {delay:.3f}s) to replica {second}")
+                self._hedged += 1
+                calls.append(self._submit(wrapped, second, args, kwargs))
+
+            futures = { c[0]: c for c in calls }
+            pending = set(futures)
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    if fut.exception() is None:
+                        latency.add(time.monotonic() - start)
+                        for other in pending:
+                            _, i, token = futures[other]
+                            threading.Thread(target=self._handles[i].kill,
+                                             args=(token,), daemon=True).start()
+                        return fut.result()
+                    error = error or fut.exception()
+            raise error
+
+        return _sh
+
+    def _pick(self, exclude:int=None) -> int:
+        with self._lock:
+            loads = [ (n, i) for i,n in enumerate(self._inflight) if i != exclude ]
+            return min(loads)[1]
+
+    def _submit(self, wrapped, i, args, kwargs):
+        """
+        Run wrapped[i] in a thread, return (future, replica index, token)
+        """
+        token = uuid.uuid4().hex
+        future = Future()
+
+        def _run():
+            try:
+                future.set_result(wrapped[i](*args, _token=token, **kwargs))
+            except BaseException as err:
+                future.set_exception(err)
+            finally:
+                with self._lock:
+                    self._inflight[i] -= 1
+
+        with self._lock:
+            self._inflight[i] += 1
+        threading.Thread(target=_run, daemon=True).start()
+        return future, i, token
@@ -0,0 +1,204 @@
+"""
+Journal of batch executions, to resume them where they stopped
+"""
+import hashlib
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+
+from . import _log as log
+
+OK = 'ok'
+FAILED = 'failed'
+
+_READ_SIZE = 2**20
+
+# Identities sorted at once (as Python ints) when numpy is not installed
+_SORT_CHUNK = 2**16
+
+
+def identity(command:str) -> int:
+    """
+    Return the (64 bits) identity of 'command' line
+    """
+    return int.from_bytes(hashlib.blake2b(command.encode(), digest_size=8).digest(), 'big')
+
+
+class Journal(object):
+    """
+    Append-only journal of commands' status, exit code and duration
+
+    Each record is a line: identity (hash of the mapped command line, hex),
+    status ('ok', 'failed'), exit code, duration (seconds) and time.
+    Records are flushed to disk (fsync) every 'sync_every' records or
+    'sync_interval' seconds, whichever comes first.
+
+    When opened, the identities of commands completed successfully are read
+    in a compact sorted array (8 bytes per command), used to skip those.
+    """
+    def __init__(self, path:str, sync_every:int=100, sync_interval:float=1.0):
+        self._path = path
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._done = _replay(path)
+        self._file = open(path, 'ab')
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+        log.debug(f"Journal '{path}': {len(self._done)} commands completed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._done)
+
+    def __contains__(self, command:str) -> bool:
+        """
+        Return True if 'command' line completed successfully
+        """
+        ident = identity(command)
+        i = bisect_left(self._done, ident)
+        return i < len(self._done) and self._done[i] == ident
+
+    def record(self, command:str, status:str, exit_code:int, duration:float):
+        """
+        Append record of 'command' line execution
+        """
+        line = (f'{identity(command):016x}\t{status}\t{exit_code}'
+                f'\t{duration:.3f}\t{time.time():.0f}\n')
+        with self._lock:
+            self._file.write(line.encode())
+            self._unsynced += 1
+            now = time.monotonic()
+            if (self._unsynced >= self._sync_every
+                    or now - self._synced_at >= self._sync_interval):
+                self._sync(now)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync(time.monotonic())
+                self._file.close()
+
+    def _sync(self, now):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = now
+
+
+def _replay(path):
+    """
+    Return sorted array of identities of commands completed in journal 'path'
+    """
+    done = array('Q')
+    if not os.path.exists(path):
+        return done
+    ok = ('\t' + OK + '\t').encode()
+    tail = b''
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(_READ_SIZE), b''):
+            lines = (tail + chunk).split(b'\n')
+            tail = lines.pop()
+            for line in lines:
+                if line[16:20] == ok:
+                    done.append(int(line[:16], 16))
+    # an incomplete last line (crash while writing) is ignored
+    return _sorted(done)
+
+
+def _sorted(values):
+    """
+    Return array 'values' sorted, without holding them all as Python ints
+
+    Sorted in place by numpy if installed; otherwise identities (uniform
+    hashes) are spread in buckets by their leading bits, each bucket sorted
+    on its own and the buckets joined in order.
+    """
+    # imported here: 'import shoosh' does not pay for it
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        numpy.frombuffer(values, dtype=numpy.uint64).sort()
+        return values
+    bits = (len(values) // _SORT_CHUNK).bit_length()
+    if not bits:
+        return array('Q', sorted(values))
+    shift = 64 - bits
+    buckets = [ array('Q') for _ in range(1 << bits) ]
+    for value in values:
+        buckets[value >> shift].append(value)
+    del values[:]
+    for bucket in buckets:
+        values.extend(sorted(bucket))
+        del bucket[:]
+    return values
+
+
+def batch(wrapped, items, journal:Journal, workers:int=1) -> dict:
+    """
+    Run 'wrapped' command for each of 'items', skipping those done in 'journal'
+
+    Each item is either a tuple of positional arguments, a dictionary of
+    keyword arguments, or a single argument. Items are identified by the
+    command line they map to (see 'Shoosh.wrap'), so a batch interrupted can
+    be run again (same items, same journal) and continue where it stopped.
+
+    Input:
+        wrapped: callable
+            Command from 'Shoosh.wrap'
+        items: iterable
+            Arguments of each command run
+        journal: Journal
+            Journal of the batch
+        workers: int
+            Number of commands running concurrently
+
+    Output:
+        Counts of items 'done', 'failed' and 'skipped' (done before)
+    """
+    counts = dict(done=0, failed=0, skipped=0)
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def _run(args, kwargs, command):
+        start = time.monotonic()
+        try:
+            res = wrapped(*args, **kwargs)
+            status, code = OK, getattr(res, 'exit_code', 0)
+        except Exception as err:
+            log.error(f"Batch item failed: {command}")
+            status, code = FAILED, getattr(err, 'exit_code', -1)
+        finally:
+            slots.release()
+        journal.record(command, status, code, time.monotonic() - start)
+        with lock:
+            counts['done' if status == OK else 'failed'] += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            args, kwargs = _arguments(item)
+            command = wrapped.command(*args, **kwargs)
+            if command in journal:
+                counts['skipped'] += 1
+                continue
+            slots.acquire()
+            pool.submit(_run, args, kwargs, command)
+    return counts
+
+
+def _arguments(item):
+    if isinstance(item, dict):
+        return (), item
+    if isinstance(item, (tuple, list)):
+        return tuple(item), {}
+    return (item,), {}
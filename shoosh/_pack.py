@@ -0,0 +1,94 @@
+"""
+Packing of many path arguments in few command invocations (like xargs)
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import _log as log
+
+# Longest single argument of a process in Linux (MAX_ARG_STRLEN, 32 pages):
+# the command line runs as one argument of 'bash -c'
+MAX_ARG_STRLEN = 131072
+
+# Bytes kept free for what is added to the command line (tracking, pinning)
+MARGIN = 4096
+
+# Default maximum number of paths per invocation
+MAX_ARGS = 5000
+
+
+def pack(wrapped, paths, args=(), kwargs=None, max_args:int=MAX_ARGS,
+         max_bytes:int=None, workers:int=1) -> list:
+    """
+    Run 'wrapped' with as many of 'paths' per invocation as fit, return packs
+
+    Paths are appended to the positional 'args' of each invocation, followed
+    by 'kwargs' (see 'Shoosh.wrap'). Invocations get at most 'max_args' paths
+    and a command line of at most 'max_bytes' bytes (mapped paths), itself
+    bounded by the container 'ARG_MAX' and the longest argument of a process.
+    'paths' is consumed as it goes, packs are run as soon as full, 'workers'
+    of them at once.
+
+    Output:
+        List of packs, in order: {'paths', 'result', 'error'}
+    """
+    kwargs = kwargs or {}
+    limit = _limit(wrapped.handle, max_bytes)
+    base = len(wrapped.command(*args, **kwargs).encode()) + MARGIN
+    if base >= limit:
+        raise ValueError(f"Command line without paths above limit ({limit} bytes)")
+
+    maps = (wrapped.handle.mappings or {}).get(tuple)
+    packs = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(workers * 2)
+
+    def _run(report):
+        try:
+            report['result'] = wrapped(*args, *report['paths'], **kwargs)
+        except Exception as err:
+            log.error(f"Pack of {len(report['paths'])} paths failed: {err}")
+            report['error'] = err
+        finally:
+            slots.release()
+
+    def _submit(pool, batch):
+        report = dict(paths=batch, result=None, error=None)
+        with lock:
+            packs.append(report)
+        slots.acquire()
+        pool.submit(_run, report)
+
+    from ._sh import _map_arg
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batch = []
+        size = base
+        for path in paths:
+            length = len(str(_map_arg(path, maps)).encode()) + 1
+            if batch and (len(batch) >= max_args or size + length > limit):
+                _submit(pool, batch)
+                batch = []
+                size = base
+            if size + length > limit:
+                raise ValueError(f"Path longer than command line limit: {path}")
+            batch.append(path)
+            size += length
+        if batch:
+            _submit(pool, batch)
+    log.debug(f"{sum(len(p['paths']) for p in packs)} paths in {len(packs)} packs")
+    return packs
+
+
+def _limit(handle, max_bytes=None):
+    """
+    Return the maximum command line length (bytes) of 'handle'
+    """
+    if handle._arg_max is None:
+        try:
+            handle._arg_max = int(str(handle('getconf ARG_MAX')).split()[-1])
+        except Exception as err:
+            log.warning(f"Could not read ARG_MAX: {err}")
+            handle._arg_max = MAX_ARG_STRLEN
+    # environment is passed along with arguments, count it in the margin
+    limit = min(handle._arg_max - MARGIN, MAX_ARG_STRLEN)
+    return min(limit, max_bytes) if max_bytes else limit
@@ -0,0 +1,153 @@
+"""
+Pipelines of commands across handles, stdout of one to stdin of the next
+"""
+import subprocess
+import threading
+import time
+import uuid
+
+from . import _log as log
+
+
+class Stage(object):
+    """
+    Command line to run through 'handle', as a stage of a pipeline
+
+    Stages are created by wrapped commands ('wrapped.stage(*args)'), their
+    arguments mapped to the handle container, and piped with '|'.
+    """
+    def __init__(self, handle, command:str):
+        self.handle = handle
+        self.command = command
+
+    def __repr__(self):
+        return f"Stage('{self.command}')"
+
+    def __or__(self, other):
+        return Pipeline([self]) | other
+
+    def run(self, **kwargs) -> dict:
+        return Pipeline([self]).run(**kwargs)
+
+
+class Pipeline(object):
+    """
+    Stages whose processes are connected stdout to stdin by OS pipes
+
+    Each stage runs as its own 'docker exec -i' (or local shell) process,
+    the standard output file descriptor of one being the standard input of
+    the next: data goes from process to process through the kernel pipe,
+    never read into Python.
+
+    Example:
+        gdal = shoosh.init('gdal').wrap('gdal_translate')
+        isis = shoosh.init('isis').wrap('isis_import')
+        report = (gdal.stage('-of', 'ENVI', 'in.tif', '/vsistdout/')
+                  | isis.stage('from=/dev/stdin', 'to=/data/out.cub')).run()
+    """
+    def __init__(self, stages:list):
+        self.stages = list(stages)
+
+    def __repr__(self):
+        return ' | '.join(s.command for s in self.stages)
+
+    def __or__(self, other):
+        if isinstance(other, Stage):
+            return Pipeline(self.stages + [other])
+        if isinstance(other, Pipeline):
+            return Pipeline(self.stages + other.stages)
+        return NotImplemented
+
+    def run(self, stdin=None, stdout=None, timeout:float=None) -> dict:
+        """
+        Run all stages at once, return report once they all finished
+
+        Input:
+            stdin: file or int
+                Input of the first stage (file object or descriptor), none by default
+            stdout: file or int
+                Output of the last stage (file object or descriptor); if not
+                given, it is returned in the report ('output')
+            timeout: float
+                Seconds after which stages still running are terminated
+
+        Output:
+            Report:
+                stages: [{command, exit_code, start, end, duration}]
+                exit_codes: exit code of each stage
+                wall_time: seconds from first stage start to last stage end
+                output: output of the last stage (bytes), if 'stdout' not given
+        """
+        log.debug(f"Pipeline: {self}")
+        tokens = [ uuid.uuid4().hex for _ in self.stages ]
+        procs = []
+        times = []
+        previous = stdin if stdin is not None else subprocess.DEVNULL
+        start = time.monotonic()
+        try:
+            for i, (stage, token) in enumerate(zip(self.stages, tokens)):
+                last = i == len(self.stages) - 1
+                out = (stdout if stdout is not None else subprocess.PIPE) if last \
+                      else subprocess.PIPE
+                proc = subprocess.Popen(stage.handle._argv(stage.command, token),
+                                        stdin=previous, stdout=out)
+                times.append([time.monotonic(), None])
+                if procs:
+                    # only the stages hold the pipe ends now
+                    procs[-1].stdout.close()
+                procs.append(proc)
+                previous = proc.stdout
+
+            waiters = [ threading.Thread(target=_wait, args=(p, t), daemon=True)
+                        for p,t in zip(procs, times) ]
+            output = []
+            if stdout is None:
+                waiters.append(threading.Thread(target=_read, daemon=True,
+                                                args=(procs[-1].stdout, output)))
+            for waiter in waiters:
+                waiter.start()
+            deadline = timeout and start + timeout
+            for waiter in waiters:
+                waiter.join(deadline and max(deadline - time.monotonic(), 0))
+            if any(w.is_alive() for w in waiters):
+                log.error(f"Pipeline timed out, terminating it: {self}")
+                self._kill(procs, tokens)
+                for waiter in waiters:
+                    waiter.join()
+        except BaseException:
+            self._kill(procs, tokens)
+            raise
+        finally:
+            for stage, token in zip(self.stages, tokens):
+                stage.handle._untrack(token)
+
+        stages = []
+        for stage, proc, (begin, end) in zip(self.stages, procs, times):
+            stages.append(dict(command = stage.command,
+                               exit_code = proc.returncode,
+                               start = begin - start,
+                               end = end - start,
+                               duration = end - begin))
+            if proc.returncode:
+                log.error(f"Exit code {proc.returncode}: {stage.command}")
+        return dict(stages = stages,
+                    exit_codes = [ s['exit_code'] for s in stages ],
+                    wall_time = max(s['end'] for s in stages),
+                    output = output[0] if output else None)
+
+    def _kill(self, procs, tokens):
+        for stage, proc, token in zip(self.stages, procs, tokens):
+            if proc.poll() is None:
+                if stage.handle._container:
+                    stage.handle.kill(token)
+                proc.terminate()
+
+
+def _wait(proc, times):
+    proc.wait()
+    times[1] = time.monotonic()
+
+
+def _read(pipe, output):
+    with pipe:
+        output.append(pipe.read())
@@ -0,0 +1,125 @@
+"""
+Placement of concurrent commands on disjoint CPU sets of a container
+"""
+import math
+import shlex
+import threading
+import time
+from contextlib import contextmanager
+from io import StringIO
+
+from . import _log as log
+from . import _docker as docker
+
+# Print: container cpuset (or number of CPUs), then the pinning tools available
+_CPUSET = r"""
+cat /sys/fs/cgroup/cpuset.cpus.effective 2>/dev/null \
+    || cat /sys/fs/cgroup/cpuset/cpuset.effective_cpus 2>/dev/null \
+    || echo "0-$(($(nproc) - 1))"
+command -v numactl || true
+command -v taskset || true
+"""
+
+_placements = {}
+_placements_lock = threading.Lock()
+
+
+def placement(container:str, host:str=None):
+    """
+    Return the Placement (shared) of 'container' (at docker 'host')
+
+    Raises RuntimeError if the container cpuset could not be read.
+    """
+    with _placements_lock:
+        if (host, container) not in _placements:
+            _placements[(host, container)] = Placement(container, host=host)
+        return _placements[(host, container)]
+
+
+class Placement(object):
+    """
+    Assign disjoint sets of CPUs (from the container cpuset) to running commands
+
+    Each command gets 'cpus' CPUs, not used by any other command placed in
+    the container; it waits if not enough CPUs are free. Commands are pinned
+    with 'numactl --physcpubind' if available in the container, 'taskset'
+    otherwise. Handles to the same container share one Placement (see
+    'placement'), so that their commands get disjoint CPUs too.
+    """
+    def __init__(self, container:str, cpus:int=1, host:str=None):
+        self._container = container
+        self._cpus = cpus
+        cpuset, self._tool = _container_cpuset(container, host)
+        self._free = list(cpuset)
+        self._all = list(cpuset)
+        self._cond = threading.Condition()
+        if not self._tool:
+            log.warning(f"Neither 'numactl' nor 'taskset' found in '{container}'")
+        log.debug(f"Container '{container}' cpuset: {cpuset} ({self._tool})")
+
+    @property
+    def cpuset(self) -> list:
+        return list(self._all)
+
+    @property
+    def tool(self) -> str:
+        return self._tool
+
+    def acquire(self, cpus:int=None, timeout:float=None) -> list:
+        """
+        Return a list of 'cpus' free CPUs, waiting (up to 'timeout') for them
+        """
+        count = min(max(1, math.ceil(cpus or self._cpus)), len(self._all))
+        deadline = timeout is not None and time.monotonic() + timeout
+        with self._cond:
+            while len(self._free) < count:
+                wait = deadline and deadline - time.monotonic()
+                if wait is not False and wait <= 0:
+                    raise TimeoutError(f"No free CPUs in '{self._container}'")
+                self._cond.wait(wait or None)
+            assigned = self._free[:count]
+            del self._free[:count]
+        return assigned
+
+    def release(self, assigned:list):
+        """
+        Give back CPUs 'assigned' (as returned by 'acquire')
+        """
+        with self._cond:
+            self._free = sorted(self._free + assigned)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, cpus:int=None, timeout:float=None):
+        """
+        Context manager holding a set of CPUs, return the list of CPUs
+        """
+        assigned = self.acquire(cpus, timeout)
+        try:
+            yield assigned
+        finally:
+            self.release(assigned)
+
+    def pin(self, command:str, assigned:list) -> str:
+        """
+        Return 'command' line bound to CPUs 'assigned'
+        """
+        cpus = ','.join(str(c) for c in assigned)
+        if self._tool == 'numactl':
+            return f'numactl --physcpubind={cpus} -- bash -c {shlex.quote(command)}'
+        if self._tool == 'taskset':
+            # Bind the shell itself, all of its children inherit it
+            return f'taskset -c -p {cpus} $$ > /dev/null; {command}'
+        return command
+
+
+def _container_cpuset(container, host=None):
+    buf = StringIO()
+    res = docker.execute(container, 'sh', '-c', _CPUSET, host=host, _out=buf)
+    lines = buf.getvalue().split() if res is not None else []
+    if not lines:
+        raise RuntimeError(f"Could not read cpuset of container '{container}'")
+    cpuset = docker.parse_cpuset(lines[0])
+    tools = [ l.rsplit('/', 1)[-1] for l in lines[1:] ]
+    tool = 'numactl' if 'numactl' in tools else ('taskset' if 'taskset' in tools else None)
+    return cpuset, tool
@@ -0,0 +1,208 @@
+"""
+Pool of warm (pre-started) containers leased as shoosh handles
+"""
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import _log as log
+from . import _docker as docker
+from ._sh import Shoosh
+
+
+class Pool(object):
+    """
+    Keep 'min_idle' containers of 'image' running, ready to be leased
+
+    Containers are started from 'image' with 'volumes' bound, and handed
+    over to callers as (shoosh) handles through 'lease()'; once done, callers
+    give them back with 'release()'. The pool grows on demand up to 'max_size'
+    containers, and shrinks back to 'max_idle' idle ones once they have been
+    idle for more than 'idle_timeout' seconds (checked every 'idle_timeout'
+    seconds in a background thread, until 'close()').
+
+    Example:
+        pool = Pool('osgeo/gdal', volumes=[('/data','/data')], min_idle=2)
+        with pool.leased() as sh:
+            sh.wrap('gdalinfo')('/data/raster.tif')
+    """
+    def __init__(self, image:str, volumes:list=None,
+                 min_idle:int=1, max_size:int=4, max_idle:int=None,
+                 idle_timeout:float=60, prefix:str=None):
+        assert 0 <= min_idle <= max_size
+        if volumes and len(volumes) == 2 and isinstance(volumes[0], str):
+            volumes = [volumes]
+        self._image = image
+        self._volumes = volumes
+        self._min_idle = min_idle
+        self._max_size = max_size
+        self._max_idle = max(max_idle or min_idle, min_idle)
+        self._idle_timeout = idle_timeout
+        self._prefix = prefix or f'shoosh-pool-{uuid.uuid4().hex[:6]}'
+        self._count = 0
+        self._idle = []         # [(handle, idle-since)]
+        self._leased = {}       # id(handle) -> handle
+        self._starting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._closing = threading.Event()
+        self.scale()
+        threading.Thread(target=self._reap, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def size(self):
+        """
+        Return the number of containers (idle, leased and starting)
+        """
+        return len(self._idle) + len(self._leased) + self._starting
+
+    @property
+    def stats(self):
+        """
+        Return counts of idle, leased and starting containers
+        """
+        with self._cond:
+            return dict(idle = len(self._idle),
+                        leased = len(self._leased),
+                        starting = self._starting)
+
+    def lease(self, timeout:float=None):
+        """
+        Return a shoosh handle to an idle container
+
+        If no container is idle, a new one is started if 'max_size' allows,
+        otherwise wait (up to 'timeout' seconds) for a container to be released.
+        """
+        deadline = timeout is not None and time.monotonic() + timeout
+        with self._cond:
+            while not self._idle:
+                if self._closed:
+                    log.error("Pool is closed")
+                    return None
+                if self.size < self._max_size:
+                    self._starting += 1
+                    self._cond.release()
+                    try:
+                        sh = self._start()
+                    finally:
+                        self._cond.acquire()
+                        self._starting -= 1
+                        self._cond.notify_all()
+                    if sh and self._closed:
+                        self._stop(sh)
+                        sh = None
+                    if not sh:
+                        return None
+                    break
+                wait = deadline and deadline - time.monotonic()
+                if wait is not False and wait <= 0:
+                    log.error(f"No container available in pool '{self._prefix}'")
+                    return None
+                self._cond.wait(wait or None)
+            else:
+                sh,_ = self._idle.pop()
+            self._leased[id(sh)] = sh
+        self.scale()
+        return sh
+
+    def release(self, sh:Shoosh):
+        """
+        Give handle 'sh' (from 'lease()') back to the pool
+        """
+        with self._cond:
+            if self._leased.pop(id(sh), None) is None:
+                log.error(f"Handle '{sh}' does not belong to pool '{self._prefix}'")
+                return
+            self._idle.append((sh, time.monotonic()))
+            self._cond.notify()
+        self.scale()
+
+    @contextmanager
+    def leased(self, timeout:float=None):
+        """
+        Context manager leasing a handle, released on exit
+        """
+        sh = self.lease(timeout)
+        try:
+            yield sh
+        finally:
+            if sh:
+                self.release(sh)
+
+    def scale(self):
+        """
+        Start/stop containers to keep between 'min_idle' and 'max_idle' idle
+        """
+        with self._cond:
+            if self._closed:
+                return
+            now = time.monotonic()
+            expired = [ s for s,t in self._idle[:-self._max_idle or None]
+                        if now - t > self._idle_timeout ]
+            self._idle = [ (s,t) for s,t in self._idle if s not in expired ]
+            missing = min(self._min_idle - len(self._idle) - self._starting,
+                          self._max_size - self.size)
+            self._starting += max(missing, 0)
+
+        for sh in expired:
+            self._stop(sh)
+        for _ in range(missing):
+            threading.Thread(target=self._warm, daemon=True).start()
+
+    def close(self):
+        """
+        Stop and remove all containers of this pool
+        """
+        self._closing.set()
+        with self._cond:
+            self._closed = True
+            while self._starting:
+                self._cond.wait()
+            handles = [ s for s,_ in self._idle ] + list(self._leased.values())
+            self._idle = []
+            self._leased = {}
+            self._cond.notify_all()
+        for sh in handles:
+            self._stop(sh)
+
+    def _reap(self):
+        while not self._closing.wait(self._idle_timeout):
+            self.scale()
+
+    def _warm(self):
+        try:
+            sh = self._start()
+            with self._cond:
+                if sh and not self._closed:
+                    self._idle.append((sh, time.monotonic()))
+                    sh = None
+            if sh:
+                self._stop(sh)
+        finally:
+            with self._cond:
+                self._starting -= 1
+                self._cond.notify_all()
+
+    def _start(self):
+        with self._cond:
+            self._count += 1
+            name = f'{self._prefix}-{self._count}'
+        if docker.run(self._image, name, self._volumes) is None:
+            log.error(f"Could not start container '{name}'")
+            return None
+        log.debug(f"Container '{name}' started")
+        sh = Shoosh(name)
+        sh.set_docker(name, self._volumes)
+        return sh
+
+    def _stop(self, sh):
+        name = sh._container
+        docker.remove(name, force=True)
+        log.debug(f"Container '{name}' removed")
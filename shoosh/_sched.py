@@ -0,0 +1,240 @@
+"""
+Scheduling of commands with priorities and concurrency limits
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from . import _log as log
+
+
+def slot_key(container:str=None, host:str=None) -> str:
+    """
+    Return the scheduler key of 'container' at docker 'host'
+
+    Containers of the default daemon are keyed by name, those of another
+    endpoint 'name@host'; commands run locally by 'localhost'.
+    """
+    key = container or 'localhost'
+    return f'{key}@{host}' if host else key
+
+
+class Scheduler(object):
+    """
+    Limit the number of commands running concurrently, globally and per container
+
+    Commands wait in queue for a slot, served by (lower first) 'priority';
+    among the same priority, the pipeline served the least so far goes first
+    -- so that one pipeline submitting many commands does not starve others --
+    and then by order of arrival. A pipeline is counted from when it has
+    commands queued or running: it starts level with the least served active
+    pipeline, and is forgotten once idle, so that a newcomer does not starve
+    pipelines that have been running for long. A command waiting more than its 'deadline'
+    (seconds) leaves the queue with a TimeoutError.
+
+    A Scheduler is meant to be shared between handles (see
+    'Shoosh.set_scheduler'); containers are identified by 'key' (see
+    'slot_key').
+
+    Input:
+        max_total: int
+            Maximum number of commands running at once (None for no limit)
+        max_per_container: int
+            Maximum number of commands running at once per container
+    """
+    def __init__(self, max_total:int=None, max_per_container:int=None):
+        self._max_total = max_total
+        self._max_per_key = max_per_container
+        self._limits = {}
+        self._queue = []
+        self._running = defaultdict(int)
+        self._served = {}
+        self._active = defaultdict(int)
+        self._stats = defaultdict(_Stats)
+        self._total = 0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def set_limit(self, key:str, limit:int):
+        """
+        Set maximum number of concurrent commands in container 'key'
+
+        A 'None' limit resets it to the default ('max_per_container').
+        """
+        with self._lock:
+            if limit is None:
+                self._limits.pop(key, None)
+            else:
+                self._limits[key] = limit
+            self._dispatch()
+
+    def limit(self, key:str):
+        """
+        Return maximum number of concurrent commands in container 'key'
+        """
+        return self._limits.get(key, self._max_per_key)
+
+    def acquire(self, key:str, priority:int=0, deadline:float=None, pipeline=None):
+        """
+        Wait for a slot in container 'key', raise TimeoutError after 'deadline'
+        """
+        waiter = _Waiter(key, priority, pipeline, next(self._seq))
+        with self._lock:
+            if not self._active[pipeline]:
+                self._served[pipeline] = min(self._served.values(), default=0)
+            self._active[pipeline] += 1
+            self._queue.append(waiter)
+            self._stats[key].queued += 1
+            self._dispatch()
+
+        try:
+            if waiter.event.wait(deadline):
+                return
+        except BaseException:
+            # interrupted: give back the slot, or leave the queue
+            with self._lock:
+                if waiter.granted:
+                    self._release(key, pipeline)
+                else:
+                    self._leave(waiter)
+            raise
+        with self._lock:
+            if waiter.granted:
+                return
+            self._leave(waiter)
+            self._stats[key].expired += 1
+        log.error(f"Command for '{key}' waited more than {deadline}s in queue")
+        raise TimeoutError(f"Deadline ({deadline}s) expired in queue for '{key}'")
+
+    def release(self, key:str, pipeline=None):
+        """
+        Release a slot in container 'key' (held by 'pipeline')
+        """
+        with self._lock:
+            self._release(key, pipeline)
+
+    @contextmanager
+    def slot(self, key:str, priority:int=0, deadline:float=None, pipeline=None):
+        """
+        Context manager holding a slot in container 'key'
+        """
+        self.acquire(key, priority, deadline, pipeline)
+        try:
+            yield
+        finally:
+            self.release(key, pipeline)
+
+    def stats(self) -> dict:
+        """
+        Return queue/execution statistics, per container and total
+
+        For each container (key), and 'total':
+            queued, running: current number of commands waiting/running
+            served, expired: number of commands granted/expired a slot
+            wait_mean, wait_max: seconds commands waited in queue
+        """
+        total = _Stats()
+        with self._lock:
+            out = { k: s.asdict() for k,s in self._stats.items() }
+            for s in self._stats.values():
+                total.add(s)
+        out['total'] = total.asdict()
+        return out
+
+    def _available(self, key):
+        if self._max_total is not None and self._total >= self._max_total:
+            return False
+        limit = self.limit(key)
+        return limit is None or self._running[key] < limit
+
+    def _release(self, key, pipeline):
+        """
+        Release a slot in container 'key' (lock held)
+        """
+        self._running[key] -= 1
+        self._total -= 1
+        self._stats[key].running -= 1
+        self._idle(pipeline)
+        self._dispatch()
+
+    def _leave(self, waiter):
+        """
+        Remove a waiter not granted a slot from the queue (lock held)
+        """
+        self._queue.remove(waiter)
+        self._stats[waiter.key].queued -= 1
+        self._idle(waiter.pipeline)
+        self._dispatch()
+
+    def _idle(self, pipeline):
+        """
+        Forget 'pipeline' counts if it has no command queued or running
+        """
+        self._active[pipeline] -= 1
+        if not self._active[pipeline]:
+            del self._active[pipeline]
+            self._served.pop(pipeline, None)
+
+    def _dispatch(self):
+        """
+        Grant slots to waiting commands while there is room (lock held)
+        """
+        while self._queue:
+            ready = [ w for w in self._queue if self._available(w.key) ]
+            if not ready:
+                return
+            waiter = min(ready, key=lambda w: (w.priority,
+                                               self._served[w.pipeline],
+                                               w.seq))
+            self._queue.remove(waiter)
+            self._running[waiter.key] += 1
+            self._served[waiter.pipeline] += 1
+            self._total += 1
+            self._stats[waiter.key].grant(time.monotonic() - waiter.since)
+            waiter.granted = True
+            waiter.event.set()
+
+
+class _Waiter(object):
+    __slots__ = ('key', 'priority', 'pipeline', 'seq', 'since', 'event', 'granted')
+
+    def __init__(self, key, priority, pipeline, seq):
+        self.key = key
+        self.priority = priority
+        self.pipeline = pipeline
+        self.seq = seq
+        self.since = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class _Stats(object):
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.served = 0
+        self.expired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def grant(self, wait):
+        self.queued -= 1
+        self.running += 1
+        self.served += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def add(self, other):
+        for k in ('queued', 'running', 'served', 'expired', 'wait_total'):
+            setattr(self, k, getattr(self, k) + getattr(other, k))
+        self.wait_max = max(self.wait_max, other.wait_max)
+
+    def asdict(self):
+        return dict(queued = self.queued,
+                    running = self.running,
+                    served = self.served,
+                    expired = self.expired,
+                    wait_mean = self.served and self.wait_total / self.served,
+                    wait_max = self.wait_max)
@@ -1,4 +1,17 @@
+import atexit
+import mmap
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import ExitStack
+
+from sh import ErrorReturnCode, TimeoutException
+
 from . import log
+from ._flight import SingleFlight
 
 try:
     from . import _docker as docker
@@ -8,6 +21,29 @@ except:
 
 KWARGS_SEP = '='
 
+# Keywords of wrapped commands handled by shoosh (passed to '__call__')
+CALL_OPTIONS = ('_priority', '_deadline', '_pipeline', '_timeout', '_token',
+                '_resources', '_out', '_err')
+
+# Keywords of wrapped commands handled by the wrapper itself
+WRAP_OPTIONS = ('_outputs', '_inputs', '_stdout')
+
+# Seconds between TERM and KILL signals to in-container processes
+KILL_GRACE = 5
+
+# Local shell, argv taking the command line as last argument
+_SHELL_ARGV = ['bash', '--login', '-c']
+
+# Commands running in containers: token -> (handle id, container, pidfile, host)
+_tracked = {}
+_tracked_lock = threading.Lock()
+
+
+class Recreated(Exception):
+    """
+    Container was recreated since its details were cached; run again
+    """
+
 
 class Shoosh(object):
     """
@@ -33,30 +69,238 @@ class Shoosh(object):
     _maps = None
     _name = None
     _kwargs_sep = None
-
-    def __init__(self, name:str=None, kwargs_sep:str=KWARGS_SEP):
+    _container = None
+    _target = None
+    _host = None
+    _inspected = False
+    _cached = False
+    _tty = False
+    _stage = None
+    _sched = None
+    _timeout = None
+    _place = None
+    _place_cpus = 1
+    _agent = None
+    _arg_max = None
+    _readonly = None
+
+    def __init__(self, name:str=None, kwargs_sep:str=KWARGS_SEP, timeout:float=None):
         self._name = name
         self._kwargs_sep = kwargs_sep
+        self._timeout = timeout
+        self._flights = SingleFlight()
         self.reset()
 
-    def __call__(self, command):
+    def __call__(self, command, priority:int=0, deadline:float=None, pipeline=None,
+                 timeout:float=None, token:str=None, resources:dict=None, out=None,
+                 err=None, remap=None):
+        """
+        Run 'command' line, waiting for resources and scheduler if set
+
+        Input:
+            command: string
+                Command line to run
+            priority: int
+                Scheduling priority, lower values are served first
+            deadline: float
+                Maximum time (seconds) waiting, in all for resources, CPUs and
+                scheduler slot (raises TimeoutError)
+            pipeline: hashable
+                Label of the submitting pipeline, for fairness among them
+            timeout: float
+                Maximum time (seconds) running, default is the handle's timeout.
+                When expired, 'sh.TimeoutException' is raised.
+            token: string
+                Identifier of this command, to 'kill' it from another thread
+            resources: dict
+                Resources the command needs (in container), 'memory', 'cpus'
+                and/or 'disk' (eg, {'memory': '4g', 'cpus': 2}). The command
+                waits until they are available (see 'shoosh._admit').
+                If placement is set, 'cpus' is the number of CPUs to pin.
+            out: callable
+                Receives the output, line by line, as it comes (see sh '_out')
+            err: callable
+                Receives the error output, as 'out' (see sh '_err')
+            remap: callable
+                Returns the command line mapped again, if the container was
+                recreated since its details were cached (see 'shoosh.init');
+                the command is then run once more.
+
+        Output:
+            Result of the command; if placement is set (see 'set_placement'),
+            the CPUs the command was pinned to are in its attribute 'cpus'.
+        """
+        options = dict(priority=priority, deadline=deadline, pipeline=pipeline,
+                       timeout=timeout, token=token, resources=resources,
+                       out=out, err=err)
+        try:
+            return self._call(command, **options)
+        except Recreated:
+            if remap is not None:
+                command = remap()
+            return self._call(command, **options)
+
+    def _call(self, command, priority, deadline, pipeline, timeout, token, resources,
+              out, err):
         log.debug(command)
-        return self._sh(command)
+        # one deadline for all waits: each gets the time left
+        expires = deadline is not None and time.monotonic() + deadline
+
+        def _left():
+            return None if expires is False else max(expires - time.monotonic(), 0)
+
+        with ExitStack() as stack:
+            if resources and self._container:
+                from ._admit import admission
+                stack.enter_context(
+                    admission(self._container, self._host).slot(resources, _left()))
+            cpus = None
+            if self._place is not None:
+                # CPUs first: waiting for them does not hold a scheduler slot
+                from ._admit import parse_resources
+                count = resources and parse_resources(resources).get('cpus')
+                count = count or self._place_cpus
+                cpus = stack.enter_context(self._place.slot(count, _left()))
+                command = self._place.pin(command, cpus)
+                log.debug(f"Pinned to CPUs {cpus}")
+            if self._sched is not None:
+                from ._sched import slot_key
+                key = slot_key(self._container, self._host)
+                stack.enter_context(
+                    self._sched.slot(key, priority, _left(), pipeline))
+            res = self._run(command, timeout, token, out, err)
+            if cpus is not None:
+                _annotate(res, cpus=cpus)
+            return res
+
+    def _run(self, command, timeout=None, token=None, out=None, err=None):
+        """
+        Run 'command', terminating it (in container) if timed out/interrupted
+        """
+        timeout = timeout or self._timeout
+        options = dict(_timeout=timeout)
+        if out is not None:
+            options['_out'] = out
+        if err is not None:
+            options['_err'] = err
+        if not self._container:
+            return self._shell()(command, **options)
+
+        token = token or uuid.uuid4().hex
+        tracked = self._track(command, token)
+        try:
+            if self._agent is not None and self._agent.alive:
+                try:
+                    return self._agent.run(tracked, timeout, out, err)
+                except FutureTimeout:
+                    raise TimeoutException(-9, tracked)
+            return self._shell()(tracked, **options)
+        except (TimeoutException, KeyboardInterrupt, SystemExit):
+            log.error(f"Command '{token}' interrupted, terminating it.")
+            self.kill(token)
+            raise
+        except ErrorReturnCode as error:
+            if not (self._cached and b'No such container' in (error.stderr or b'')):
+                raise
+            # Container details (cache) are stale, container was recreated:
+            # arguments have to be mapped again with its current volumes
+            self._refresh()
+            raise Recreated(self._container) from error
+        finally:
+            self._untrack(token)
+
+    def _track(self, command, token):
+        """
+        Return 'command' writing its PID in container, tracked as 'token' (see 'kill')
+        """
+        pidfile = f'{docker.PID_DIR}/shoosh-{token}.pid'
+        with _tracked_lock:
+            _tracked[token] = (id(self), self._target, pidfile, self._host)
+        return f'trap "rm -f {pidfile}" EXIT; echo $$ > {pidfile}; {command}'
+
+    @staticmethod
+    def _untrack(token):
+        with _tracked_lock:
+            _tracked.pop(token, None)
+
+    def _argv(self, command, token=None):
+        """
+        Return argv running 'command' line (tracked as 'token' in container)
+        """
+        if not self._container:
+            return _SHELL_ARGV + [command]
+        return docker.exec_argv(self._target, self._host) + [self._track(command, token)]
+
+    def _refresh(self):
+        """
+        Inspect container again, replacing its (stale) cached details
+        """
+        from . import _cache as cache
+        log.debug(f"Container '{self._container}' cached details are stale")
+        cache.invalidate(self._container, self._host)
+        info = docker.inspect_many([self._container], self._host).get(self._container)
+        assert info and info['running'], f"Container '{self._container}' is not running."
+        cache.store(self._container, info, self._host)
+        self._sh = docker.bake(info['id'], check=False, host=self._host, tty=self._tty)
+        self._target = info['id']
+        if self._inspected:
+            self._maps = {tuple: tuple(info['mounts'])} if info['mounts'] else {}
+        self._readonly = info.get('readonly')
+        self._cached = False
+        # staged content and agent were in the former container
+        if self._stage is not None:
+            self.set_staging(self._stage._scratch, self._stage._max_size)
+        if self._agent is not None:
+            self.set_agent()
+
+    def kill(self, token:str=None, grace:int=KILL_GRACE):
+        """
+        Terminate command 'token' in container, or all running from this handle
+
+        Processes are first signalled TERM, then KILL after 'grace' seconds.
+        """
+        with _tracked_lock:
+            tokens = [ t for t,(h,*_) in _tracked.items()
+                       if (t == token) or (token is None and h == id(self)) ]
+            running = [ _tracked[t] for t in tokens ]
+        for _, container, pidfile, host in running:
+            docker.kill_tree(container, pidfile, grace, host=host)
 
     def reset(self):
         """
         Simply start a brand new shell.
+
+        The (local) shell is created when the first command runs.
         """
-        _sh = _set_sh()
-        log.debug(_sh)
-        self._sh = _sh
+        self._sh = None
         self._maps = None
+        self._container = None
+        self._target = None
+        self._host = None
+        self._stage = None
+        self._readonly = None
+
+    def _shell(self):
+        """
+        Return the shell commands run in, created if not yet
+
+        Only the local shell is created here: a container handle whose
+        container was not available (see 'set_docker') raises RuntimeError.
+        """
+        if self._sh is None:
+            if self._container:
+                raise RuntimeError(f"Container '{self._container}' not available.")
+            _sh = _set_sh()
+            log.debug(_sh)
+            self._sh = _sh
+        return self._sh
 
     @staticmethod
     def _log(res):
         log.debug("Exit code: "+str(res and res.exit_code))
 
-    def set_docker(self, container, mappings=None, inspect=False):
+    def set_docker(self, container, mappings=None, inspect=False, info=None,
+                   host:str=None, tty:bool=False):
         """
         Set running 'container' to handle exec/commands
 
@@ -68,12 +312,31 @@ class Shoosh(object):
                 `` ('path_in_host', 'path_in_container') ``
                 or a dictionary where keys are labels/args and values the tuples:
                 `` { 'arg': ('path_in_host', 'path_in_container') } ``
+            info: dictionary
+                Container details as given by 'docker.inspect_many' (optional).
+                If given, container is not checked/inspected again, and
+                commands run in the container by its ID.
+            host: string
+                Docker daemon endpoint (eg, 'unix:///path/to/sock'), if not default
+            tty: bool
+                Run commands with a terminal ('docker exec -t'), stderr then
+                merged in stdout. By default results keep stdout/stderr
+                apart, as bytes ('res.stdout', 'res.stderr'; 'str(res)' decodes).
         """
         if docker:
-            assert container in docker.list_containers()
-            self._sh = docker.bake(container)
+            if info is None:
+                assert container in docker.list_containers(host)
+            target = info['id'] if info else container
+            self._sh = docker.bake(target, check=info is None, host=host, tty=tty)
+            self._container = container
+            self._target = target
+            self._host = host
+            self._tty = tty
+            self._inspected = bool(inspect and not mappings)
+            self._cached = False
+            self._readonly = info and info.get('readonly')
             if inspect and not mappings:
-                mappings = docker.volumes(container)
+                mappings = info['mounts'] if info else docker.volumes(container, host)
             if mappings:
                 type(mappings) in (list,tuple,dict)
                 if isinstance(mappings, list):
@@ -84,45 +347,338 @@ class Shoosh(object):
         else:
             self._log("Docker not found. Do you have it installed?")
 
-    def wrap(self, exec):
+    def set_scheduler(self, scheduler):
+        """
+        Run commands through 'scheduler' (shoosh.Scheduler), None to unset
+
+        Share the same scheduler between handles to limit the number of
+        commands running at once across them. Containers are keyed by name,
+        'name@host' for those of a docker endpoint set with 'host' (see
+        'shoosh._sched.slot_key').
+        """
+        self._sched = scheduler
+
+    def set_placement(self, cpus:int=1):
+        """
+        Pin each command to its own set of 'cpus' CPUs in the container
+
+        Commands running concurrently in the container -- through any handle
+        with placement set -- get disjoint sets of CPUs from the container
+        cpuset (see 'shoosh._place.placement'); 'None' unsets placement.
+        Commands declaring 'cpus' in their resources get that many CPUs.
+        If the cpuset cannot be read, placement is not set (error logged).
+        """
+        if cpus is None:
+            self._place = None
+            return
+        if not self._container:
+            log.error("Placement requires a container, see 'set_docker'.")
+            return
+        from ._place import placement
+        try:
+            self._place = placement(self._container, self._host)
+        except RuntimeError as err:
+            log.error(f"{err}: commands are not placed")
+            self._place = None
+            return
+        self._place_cpus = cpus
+
+    def exists(self, paths):
+        """
+        Return whether (host) 'paths' exist in the container, in one exec
+
+        'paths' is a path or a list of them (then a list is returned); host
+        paths are mapped as for wrapped commands, other paths are taken as
+        container paths. Same for 'stat', 'glob', 'listdir' and 'walk'.
+        """
+        from . import _fs
+        return _fs.exists(self, paths)
+
+    def stat(self, paths):
+        """
+        Return size, mtime and mode of 'paths' in the container (see 'exists')
+        """
+        from . import _fs
+        return _fs.stat(self, paths)
+
+    def glob(self, patterns):
+        """
+        Return (host) paths matching 'patterns' in the container (see 'exists')
+        """
+        from . import _fs
+        return _fs.glob(self, patterns)
+
+    def listdir(self, paths):
+        """
+        Return entries of directories 'paths' in the container (see 'exists')
+        """
+        from . import _fs
+        return _fs.listdir(self, paths)
+
+    def walk(self, path:str) -> list:
+        """
+        Return (host) tree under 'path' in the container, like 'os.walk'
+        """
+        from . import _fs
+        return _fs.walk(self, path)
+
+    def translate(self, paths, reverse:bool=False):
+        """
+        Return host 'paths' translated to container paths (or back, if 'reverse')
+
+        Many paths at once -- a sequence, numpy or pyarrow array of strings --
+        by prefix only, without looking at the filesystem (see
+        'shoosh._translate.translate').
+        """
+        from ._translate import translate
+        return translate(paths, (self._maps or {}).get(tuple), reverse)
+
+    def set_agent(self, enable:bool=True):
+        """
+        Run commands through an agent in the container, sharing one exec
+
+        The agent (see 'shoosh._agent.Agent') runs commands from any thread
+        concurrently over a single 'docker exec', instead of one exec each.
+        Results have the output ('stdout', 'stderr') and 'exit_code' of the
+        commands, failures raise as usual. If the container has no Python,
+        commands keep running through one exec each.
+        """
+        if self._agent is not None:
+            self._agent.close()
+            self._agent = None
+        if not enable:
+            return
+        if not self._container:
+            log.error("Agent requires a container, see 'set_docker'.")
+            return
+        from ._agent import Agent
+        agent = Agent(self._target, self._host)
+        self._agent = agent if agent.available else None
+
+    def set_staging(self, scratch:str=None, max_size:int=None):
+        """
+        Stage host paths not covered by any volume into container 'scratch'
+
+        When set, arguments pointing to existing host files outside of every
+        mapping -- and directories declared with the '_inputs' keyword of
+        wrapped commands -- are streamed into the container (deduplicated by
+        content), and the argument is replaced by the staged path. Paths
+        larger than 'max_size' are not staged.
+        Outputs declared with the '_outputs' keyword of wrapped commands are
+        written in the container scratch dir and copied back afterwards.
+
+        Input:
+            scratch: string
+                Directory inside the container to stage files (default '/tmp/shoosh-stage')
+            max_size: int
+                Size (bytes) of staged content above which old entries are evicted
+        """
+        if not self._container:
+            log.error("Staging requires a container, see 'set_docker'.")
+            return
+        from ._stage import Stage, SCRATCH, MAX_SIZE
+        self._stage = Stage(self._target,
+                            scratch = scratch or SCRATCH,
+                            max_size = max_size or MAX_SIZE,
+                            host = self._host)
+
+    def wrap(self, exec, resources:dict=None, singleflight:bool=False):
         """
         Return a callable wrapping command 'exec'
 
         This callable (really just a closure around Sh/Bash) accepts *any*
         argument(s) or kw-argument(s) you feel like running 'exec' with.
+        If staging is set (see 'set_staging'), keyword '_outputs' declares the
+        list of host paths -- among the arguments -- to copy back once done,
+        and '_inputs' the host directories to stage (files are staged as is).
+        Keywords '_priority', '_deadline' and '_pipeline' are used for
+        scheduling (see 'set_scheduler'); '_timeout' and '_token' to control
+        the command execution (see '__call__' and 'kill'), '_out' and '_err'
+        to receive its output and error output as they come.
+        With keyword '_stdout="volume"', the command output is written to a
+        temporary file in a mapped volume instead of going through the exec
+        stream, and the call returns it as a (read-only) memory-mapped buffer.
+        The callable's 'command(*args, **kwargs)' returns the command-line it
+        would run, 'stage(*args, **kwargs)' the same as a pipeline stage
+        (see 'shoosh._pipe'), 'pack(paths, *args, **kwargs)' runs it for many
+        paths in few invocations, and 'handle' is this (shoosh) instance.
 
         Input:
             * exec : str
                 Command name to wrap (e.g, "echo")
+            * resources : dict
+                Resources declared for each call (e.g, {'memory': '4g'}),
+                overridden by keyword '_resources' (see '__call__')
+            * singleflight : bool
+                If True, concurrent calls with the same (mapped) command-line
+                and the same '_stdout'/'_outputs'/'_inputs' share one execution, all of
+                them get its result (or exception). Calls with '_out' or
+                '_err' callbacks always run on their own.
         """
         if isinstance(exec, str):
             exec = [exec]
 
-        def _sh(*args, **kwargs):
+        def _command(args, kwargs, transfer=None):
             """
-            Run and return result of 'exec' in 'sh_local' with argument 'args/kwargs'
+            Return command-line of 'exec' with arguments 'args/kwargs' mapped
             """
-            if self._maps:
-                _maps_t = self._maps.get(tuple, None)
-                v = [ _map_arg(v, _maps_t) for v in args ]
-                _maps_d = self._maps.get(dict, None)
+            _maps_t = self._maps and self._maps.get(tuple, None)
+            if self._maps or transfer:
+                v = [ _map_arg(v, _maps_t, transfer) for v in args ]
+                _maps_d = self._maps and self._maps.get(dict, None)
                 if _maps_d:
-                    kv = [ _map_kwarg_d(k, v, _maps_d.get(k), self._kwargs_sep)
+                    kv = [ _map_kwarg_d(k, v, _maps_d.get(k), self._kwargs_sep, transfer)
                             for k,v in kwargs.items() ]
                 else:
-                    kv = [ _map_kwarg_t(k, v, _maps_t, self._kwargs_sep)
+                    kv = [ _map_kwarg_t(k, v, _maps_t, self._kwargs_sep, transfer)
                             for k,v in kwargs.items() ]
             else:
                 v = [f'{v}' for v in args]
                 kv = [f'{k}={v}' for k,v in kwargs.items()]
 
             # 'comm' is effectively the full/command-line to run
-            comm = ' '.join(exec+v+kv)
-            log.debug(comm)
-            return self(comm)
+            return ' '.join(str(c) for c in exec+v+kv)
+
+        def _sh(*args, **kwargs):
+            """
+            Run and return result of 'exec' in 'sh_local' with argument 'args/kwargs'
+            """
+            if singleflight and not (kwargs.get('_out') or kwargs.get('_err')):
+                declared = [ tuple(os.path.abspath(p) for p in kwargs.get(k) or ())
+                             for k in ('_outputs', '_inputs') ]
+                key = (command(*args, **kwargs), kwargs.get('_stdout'), *declared)
+                return self._flights.run(key, _run, *args, **kwargs)
+            return _run(*args, **kwargs)
+
+        def _run(*args, **kwargs):
+            outputs = kwargs.pop('_outputs', None)
+            inputs = kwargs.pop('_inputs', None)
+            stdout = kwargs.pop('_stdout', None)
+            options = { k[1:]: kwargs.pop(k) for k in CALL_OPTIONS if k in kwargs }
+            options.setdefault('resources', resources)
+            _maps_t = self._maps and self._maps.get(tuple, None)
+            transfer = self._stage and self._stage.transfer(outputs, _maps_t, inputs)
+
+            def _line():
+                comm = _command(args, kwargs, transfer)
+                if transfer:
+                    comm = transfer.prepare(comm)
+                return comm
+
+            try:
+                if stdout == 'volume':
+                    return self._run_to_volume(_line, options, transfer)
+                res = self(_line(), remap=_line, **options)
+                if transfer:
+                    transfer.finish()
+                return res
+            finally:
+                if transfer:
+                    transfer.close()
+
+        def command(*args, **kwargs):
+            """
+            Return the command-line (mapped) 'exec' would run with 'args/kwargs'
+
+            Staging is not applied, and shoosh keywords ('_outputs',...) are ignored.
+            """
+            kwargs = { k:v for k,v in kwargs.items()
+                       if k not in WRAP_OPTIONS and k not in CALL_OPTIONS }
+            return _command(args, kwargs)
+
+        def stage(*args, **kwargs):
+            """
+            Return (deferred) 'exec' with 'args/kwargs', to pipe with others
 
+            Stages are connected with '|' and run with 'run()', see
+            'shoosh._pipe.Pipeline'.
+            """
+            from ._pipe import Stage
+            return Stage(self, command(*args, **kwargs))
+
+        def pack(paths, *args, max_args:int=None, max_bytes:int=None,
+                 workers:int=1, **kwargs):
+            """
+            Run 'exec' with many 'paths' per invocation (like xargs)
+
+            'paths' (iterable of host paths) is split in as few invocations as
+            fit the command-line limits, each one running 'exec' with 'args',
+            its paths, then 'kwargs'; see 'shoosh._pack.pack'.
+            """
+            from ._pack import pack as _pack, MAX_ARGS
+            return _pack(_sh, paths, args, kwargs,
+                         max_args = max_args or MAX_ARGS,
+                         max_bytes = max_bytes,
+                         workers = workers)
+
+        _sh.command = command
+        _sh.pack = pack
+        _sh.stage = stage
+        _sh.handle = self
         return _sh
 
+    def _run_to_volume(self, line, options, transfer=None):
+        """
+        Run command 'line()' writing its output in a volume, return it memory-mapped
+        """
+        if self._output_volume() is None:
+            log.warning("No writable volume for output, using exec stream.")
+            res = self(line(), remap=line, **options)
+            if transfer:
+                transfer.finish()
+            return res.stdout
+
+        name = f'.shoosh-out-{uuid.uuid4().hex}'
+        host_paths = []
+
+        def _redirected():
+            host_dir, cont_dir = self._output_volume()
+            host_paths.append(os.path.join(host_dir, name))
+            return f'{{ {line()} ; }} > {os.path.join(cont_dir, name)}'
+
+        try:
+            self(_redirected(), remap=_redirected, **options)
+            if transfer:
+                transfer.finish()
+            return _map_file(host_paths[-1])
+        finally:
+            # the mapping stays valid after the file is unlinked
+            for path in host_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def fifo(self, mode:str='r'):
+        """
+        Return a named pipe in a mapped volume to stream data to/from commands
+
+        With 'mode' "r" the host reads what commands write in it, with "w"
+        commands read what the host writes (see 'shoosh._fifo.Fifo').
+        """
+        from ._fifo import Fifo
+        return Fifo(self, mode)
+
+    def _output_volume(self):
+        """
+        Return (host, container) directory where commands can write output
+
+        Read-only mounts are skipped (container inspected once if needed).
+        """
+        if not self._container:
+            folder = tempfile.gettempdir()
+            return (folder, folder)
+        if self._readonly is None:
+            info = docker.inspect_many([self._container], self._host).get(self._container)
+            self._readonly = (info or {}).get('readonly') or []
+        maps = self._maps and self._maps.get(tuple, None)
+        for host_dir, cont_dir in maps or []:
+            if cont_dir in self._readonly:
+                continue
+            if os.path.isdir(host_dir) and os.access(host_dir, os.R_OK | os.W_OK):
+                return (host_dir, cont_dir)
+        return None
+
     @property
     def mappings(self):
         """
@@ -131,46 +687,108 @@ class Shoosh(object):
         return self._maps
 
 
-def _map_arg(value, maps):
+def _map_arg(value, maps, transfer=None):
     """
     Return mapped 'value' if mapping found in 'maps'
 
     Input:
-        value: str
-            Path (string) in the host system
+        value: str or os.PathLike
+            Path in the host system
             Ex: '/host/path/something'
         maps: list
             List of length-2 tuples [('/host/path','/container/path')]
+        transfer: shoosh._stage.Transfer
+            Staging of 'value' in case no mapping is found (optional)
 
     Output:
         Mapped value. Ex: '/container/path/something'
     """
     from os.path import exists,abspath
 
-    if maps and exists(value):
+    if maps and isinstance(value, (str, os.PathLike)) and exists(value):
         _abs = abspath(value)
         for _host, _cont in maps:
             _val = _abs.replace(_host, _cont)
             if _val != _abs:
                 return _val
 
+    if transfer:
+        return transfer.map(value)
+
     return value
 
 
-def _map_kwarg_t(key, value, maps, sep):
+def _map_path(path:str, maps, reverse:bool=False) -> str:
+    """
+    Return 'path' translated through 'maps', host to container (or back)
+
+    Unlike '_map_arg', the filesystem is not looked at: 'path' is matched
+    against the mappings prefixes (longest first), and returned as given if
+    not under any of them. Relative (host) paths are taken from the current
+    directory.
+
+    Input:
+        path: str
+            Host path, or container path if 'reverse'
+        maps: list
+            List of length-2 tuples [('/host/path','/container/path')]
+        reverse: bool
+            Translate container to host path
+    """
+    from os.path import abspath
+    from ._translate import _table, _lookup
+
+    _path = path if reverse else abspath(path)
+    new = _lookup(_path, _table(maps, reverse))
+    return path if new is None else new
+
+
+def _map_kwarg_t(key, value, maps, sep, transfer=None):
     """
     Return keyword value mapped using separator 'sep'
     """
-    _val = _map_arg(value, maps)
+    _val = _map_arg(value, maps, transfer)
     return f"{key}{sep}{_val}"
 
 
-def _map_kwarg_d(key, value, maps, sep):
+def _map_kwarg_d(key, value, maps, sep, transfer=None):
     """
     Return keyword value mapped using separator 'sep'
     """
     _maps = maps and [maps]
-    return _map_kwarg_t(key, value, _maps, sep)
+    return _map_kwarg_t(key, value, _maps, sep, transfer)
+
+
+def _annotate(res, **attrs):
+    """
+    Set 'attrs' in command result 'res', if it accepts attributes
+    """
+    for k,v in attrs.items():
+        try:
+            setattr(res, k, v)
+        except AttributeError:
+            log.debug(f"Result does not accept attribute '{k}'")
+
+
+def _map_file(path):
+    """
+    Return content of file 'path' memory-mapped (read-only), b'' if empty
+    """
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+@atexit.register
+def _kill_tracked():
+    """
+    Terminate commands still running in containers
+    """
+    with _tracked_lock:
+        running = list(_tracked.values())
+    for _, container, pidfile, host in running:
+        docker.kill_tree(container, pidfile, KILL_GRACE, host=host)
 
 
 def _set_sh():
@@ -178,4 +796,4 @@ def _set_sh():
     Return a Bash login shell
     """
     from sh import bash
-    return bash.bake('--login -c'.split())
+    return bash.bake(_SHELL_ARGV[1:])
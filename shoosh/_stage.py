@@ -0,0 +1,320 @@
+"""
+Staging of host files not covered by any volume into a container scratch dir
+"""
+import os
+import hashlib
+import stat
+import tarfile
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from os.path import abspath, basename, isdir
+
+from . import _log as log
+from . import _docker as docker
+
+SCRATCH = '/tmp/shoosh-stage'
+MAX_SIZE = 2**30
+
+# Host system directories never staged, nor anything containing them
+SYSTEM_ROOTS = ('/bin', '/boot', '/dev', '/etc', '/lib', '/lib32', '/lib64', '/proc',
+                '/run', '/sbin', '/sys', '/usr', '/var')
+
+# Directories never staged themselves, nor their parents: temporary, home and
+# mount roots (their content may be, if small enough)
+STAGING_ROOTS = ('/tmp', '/var/tmp', '/home', '/root', '/mnt', '/media', '/opt', '/srv')
+
+_CHUNK = 2**20
+
+
+class Stage(object):
+    """
+    Scratch directory inside a container where unmapped host paths are staged
+
+    Inputs are streamed into the container as a tar archive (`docker cp -`),
+    under a directory named after their content digest, so the same content
+    is transferred only once. When the staged content exceeds 'max_size'
+    bytes, the least recently used entries are removed from the container,
+    except those in use by a call (see 'put' and 'release'); a path larger
+    than 'max_size' is not staged.
+    """
+    def __init__(self, container:str, scratch:str=SCRATCH, max_size:int=MAX_SIZE,
+                 host:str=None):
+        self._container = container
+        self._host = host
+        self._scratch = scratch.rstrip('/')
+        self._max_size = max_size
+        self._index = OrderedDict()     # digest -> (container path, size)
+        self._digests = {}              # (path, size, mtime, inode) -> digest
+        self._refs = defaultdict(int)   # digest -> number of users
+        self._size = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def size(self):
+        """
+        Return the amount of bytes currently staged
+        """
+        return self._size
+
+    def put(self, path:str):
+        """
+        Return (container path, digest) of host 'path', staging it if not yet there
+
+        The entry is in use, never evicted, until 'release(digest)'. If 'path'
+        could not be staged (or is larger than 'max_size'), it is returned as
+        is with no digest.
+        """
+        if _tree_size(path) > self._max_size:
+            log.error(f"Not staging '{path}': larger than {self._max_size} bytes")
+            return path, None
+        digest, size = self._digest(path)
+        with self._lock:
+            if digest in self._index:
+                self._index.move_to_end(digest)
+                self._refs[digest] += 1
+                return self._index[digest][0], digest
+
+            self._setup()
+            name = basename(abspath(path))
+            if not self._send(path, f'{digest}/{name}'):
+                log.error(f"Could not stage '{path}' into '{self._container}'")
+                return path, None
+
+            cpath = f'{self._scratch}/{digest}/{name}'
+            self._index[digest] = (cpath, size)
+            self._size += size
+            self._refs[digest] += 1
+            log.debug(f"Staged '{path}' as '{cpath}' ({size} bytes)")
+            self._evict()
+            return cpath, digest
+
+    def release(self, digests):
+        """
+        Mark staged entries 'digests' (one per 'put') no longer in use
+        """
+        with self._lock:
+            for digest in digests:
+                self._refs[digest] -= 1
+                if self._refs[digest] <= 0:
+                    del self._refs[digest]
+            self._evict()
+
+    def get(self, cpath:str, path:str) -> bool:
+        """
+        Copy container path 'cpath' back to host 'path'
+        """
+        return docker.copy_from(self._container, cpath, path, host=self._host) is not None
+
+    def clear(self):
+        """
+        Remove all staged content from the container
+        """
+        with self._lock:
+            docker.execute(self._container, 'rm', '-rf', self._scratch, host=self._host)
+            self._index.clear()
+            self._size = 0
+            self._ready = False
+
+    def transfer(self, outputs=None, maps=None, inputs=None):
+        """
+        Return a Transfer for one command call, declaring host 'outputs' and
+        (directory) 'inputs'
+        """
+        return Transfer(self, outputs, maps, inputs)
+
+    def _setup(self):
+        if not self._ready:
+            docker.execute(self._container, 'mkdir', '-p', self._scratch, host=self._host)
+            self._ready = True
+
+    def _send(self, path, arcname):
+        """
+        Stream 'path' as a tar archive (member 'arcname') into scratch dir
+        """
+        rfd, wfd = os.pipe()
+        err = []
+
+        def _write():
+            try:
+                with os.fdopen(wfd, 'wb') as stream:
+                    with tarfile.open(fileobj=stream, mode='w|') as tar:
+                        tar.add(path, arcname=arcname)
+            except Exception as e:
+                err.append(e)
+
+        writer = threading.Thread(target=_write, daemon=True)
+        writer.start()
+        with os.fdopen(rfd, 'rb') as stream:
+            res = docker.copy_to(self._container, stream, self._scratch, host=self._host)
+        writer.join()
+        if err:
+            log.error(err[0])
+            return False
+        return res is not None
+
+    def _evict(self):
+        drop = []
+        for digest, (cpath, size) in self._index.items():
+            if self._size <= self._max_size:
+                break
+            if digest in self._refs:
+                continue
+            drop.append(digest)
+            self._size -= size
+        if not drop:
+            return
+        dirs = [ f'{self._scratch}/{d}' for d in drop ]
+        docker.execute(self._container, 'rm', '-rf', *dirs, host=self._host)
+        for digest in drop:
+            del self._index[digest]
+        log.debug(f"Evicted {len(drop)} staged entries from '{self._container}'")
+
+    def _digest(self, path):
+        """
+        Return (digest,size) of 'path' content, file or directory
+        """
+        files = [path]
+        if isdir(path):
+            files = sorted(
+                os.path.join(root, f) for root,_,fs in os.walk(path) for f in fs
+            )
+        sha = hashlib.sha256()
+        total = 0
+        for f in files:
+            st = os.lstat(f)
+            if not stat.S_ISREG(st.st_mode):
+                # links and special files are archived as such, not read
+                sha.update(f'{os.path.relpath(f, path)}:{st.st_mode}'.encode())
+                continue
+            key = (abspath(f), st.st_size, st.st_mtime_ns, st.st_ino)
+            digest = self._digests.get(key)
+            if digest is None:
+                digest = _hash_file(f)
+                self._digests[key] = digest
+            sha.update(os.path.relpath(f, path).encode())
+            sha.update(digest.encode())
+            total += st.st_size
+        return sha.hexdigest()[:32], total
+
+
+class Transfer(object):
+    """
+    Staging state of a single command call
+
+    Maps unmapped host inputs to their staged container paths and declared
+    'outputs' to a per-call container directory, copied back by 'finish()'.
+    Files are staged as they come in arguments, directories only if declared
+    in 'inputs'.
+    """
+    def __init__(self, stage:Stage, outputs=None, maps=None, inputs=None):
+        self._stage = stage
+        self._outputs = { abspath(p) for p in (outputs or []) }
+        self._inputs = { abspath(p) for p in (inputs or []) }
+        self._maps = maps
+        self._dir = f'{stage._scratch}/out-{uuid.uuid4().hex[:12]}'
+        self._pending = []
+        self._held = []
+
+    def map(self, value):
+        """
+        Return container path for unmapped host path 'value'
+
+        Only regular files and declared ('inputs') directories are staged,
+        never special files (devices, pipes, sockets), system directories
+        ('SYSTEM_ROOTS') nor temporary, home and mount roots ('STAGING_ROOTS').
+        """
+        if not isinstance(value, (str, os.PathLike)):
+            return value
+        path = abspath(value)
+        if path in self._outputs:
+            return self._output(path)
+        if _stageable(path, path in self._inputs):
+            cpath, digest = self._stage.put(path)
+            if digest is not None:
+                self._held.append(digest)
+            return cpath
+        return value
+
+    def prepare(self, command:str) -> str:
+        """
+        Return 'command' preceded by the creation of the outputs directory
+        """
+        if not self._pending:
+            return command
+        return f'mkdir -p {self._dir} && {command}'
+
+    def finish(self):
+        """
+        Copy declared outputs back to the host, then 'close()'
+        """
+        for cpath, path in self._pending:
+            if not self._stage.get(cpath, path):
+                log.error(f"Could not copy output '{cpath}' back to '{path}'")
+        self.close()
+
+    def close(self):
+        """
+        Clean the outputs directory, release staged inputs (call even on failure)
+        """
+        stage = self._stage
+        if self._pending:
+            docker.execute(stage._container, 'rm', '-rf', self._dir, host=stage._host)
+            self._pending = []
+        if self._held:
+            stage.release(self._held)
+            self._held = []
+
+    def _output(self, path):
+        for _host, _cont in (self._maps or []):
+            if path.startswith(_host.rstrip('/') + '/'):
+                return path.replace(_host, _cont, 1)
+        cpath = f'{self._dir}/{basename(path)}'
+        self._pending.append((cpath, path))
+        return cpath
+
+
+def _stageable(path, declared=False):
+    """
+    Return whether host 'path' is a regular file, or a 'declared' directory,
+    out of system dirs and not a temporary, home or mount root
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return False
+    if not (stat.S_ISREG(mode) or (declared and stat.S_ISDIR(mode))):
+        return False
+    path = path.rstrip('/') or '/'
+    if path == '/' or os.path.dirname(path) == '/home' or path == os.path.expanduser('~'):
+        return False
+    if any(path == root or root.startswith(path + '/') for root in STAGING_ROOTS):
+        return False
+    return not any(
+        path == root or path.startswith(root + '/') or root.startswith(path + '/')
+        for root in SYSTEM_ROOTS
+    )
+
+
+def _tree_size(path):
+    """
+    Return size (bytes) of the regular files of 'path', file or directory
+    """
+    if not isdir(path):
+        return os.stat(path).st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            st = os.lstat(os.path.join(root, f))
+            if stat.S_ISREG(st.st_mode):
+                total += st.st_size
+    return total
+
+
+def _hash_file(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(_CHUNK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
@@ -0,0 +1,126 @@
+"""
+Translation of many paths at once, host to container (or back)
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.compute as pc
+except ImportError:
+    pyarrow = None
+
+
+def translate(paths, maps, reverse:bool=False):
+    """
+    Return 'paths' translated through 'maps', host to container (or back)
+
+    Paths are matched against the mappings prefixes (longest first) as
+    strings only -- no filesystem access, no normalization: paths are
+    expected absolute and normalized, those not under any mapping are
+    returned as given. '_sh._map_path' translates single paths through it.
+
+    Input:
+        paths: sequence, numpy array or pyarrow (chunked) array of strings
+            Host paths, or container paths if 'reverse'
+        maps: list
+            List of length-2 tuples [('/host/path','/container/path')]
+        reverse: bool
+            Translate container to host paths
+
+    Output:
+        Translated paths, of the same kind as 'paths' (list for sequences)
+    """
+    table = _table(maps, reverse)
+    if pyarrow is not None and isinstance(paths, (pyarrow.Array, pyarrow.ChunkedArray)):
+        return _translate_arrow(paths, table)
+    if numpy is not None and isinstance(paths, numpy.ndarray):
+        return _translate_numpy(paths, table)
+    return _translate_list(paths, table)
+
+
+def _table(maps, reverse):
+    """
+    Return mappings as (source, source prefix, destination, destination prefix)
+
+    Sorted by source length, longest first, so the most specific mapping wins.
+    """
+    table = []
+    for _host, _cont in maps or ():
+        src, dst = (_cont, _host) if reverse else (_host, _cont)
+        src = src.rstrip('/') or '/'
+        dst = dst.rstrip('/') or '/'
+        table.append((src, src.rstrip('/') + '/', dst, dst.rstrip('/') + '/'))
+    return sorted(table, key=lambda t: len(t[0]), reverse=True)
+
+
+def _translate_list(paths, table):
+    out = []
+    append = out.append
+    for path in paths:
+        new = _lookup(path, table)
+        append(path if new is None else new)
+    return out
+
+
+def _lookup(path, table):
+    """
+    Return 'path' translated through 'table', None if not under any mapping
+    """
+    for src, prefix, dst, dst_prefix in table:
+        if path.startswith(prefix):
+            return dst_prefix + path[len(prefix):]
+        if path == src:
+            return dst
+    return None
+
+
+def _translate_numpy(paths, table):
+    arr = paths if paths.dtype.kind == 'U' else paths.astype(str)
+    out = arr
+    done = numpy.zeros(arr.shape, dtype=bool)
+    for src, prefix, dst, dst_prefix in table:
+        under = numpy.char.startswith(arr, prefix) & ~done
+        equal = (arr == src) & ~done
+        if not (under.any() or equal.any()):
+            continue
+        idx = numpy.nonzero(under)[0]
+        new = numpy.char.add(dst_prefix, _tails(arr[idx], len(prefix)))
+        width = max(out.itemsize, new.itemsize, len(dst) * 4) // 4
+        if width * 4 > out.itemsize:
+            out = out.astype(f'U{width}')
+        elif out is arr:
+            out = arr.copy()
+        out[idx] = new
+        out[equal] = dst
+        done |= under | equal
+    return out
+
+
+def _tails(arr, start):
+    """
+    Return strings of (fixed width) 'arr' from character 'start' on
+    """
+    width = arr.itemsize // 4
+    if width <= start or not len(arr):
+        return numpy.zeros(arr.shape, dtype='U1')
+    chars = arr.view('U1').reshape(len(arr), width)[:, start:]
+    return numpy.ascontiguousarray(chars).view(f'U{width - start}').reshape(-1)
+
+
+def _translate_arrow(paths, table):
+    out = paths
+    done = None
+    for src, prefix, dst, dst_prefix in table:
+        tails = pc.utf8_slice_codeunits(paths, start=len(prefix))
+        equal = pc.fill_null(pc.equal(paths, src), False)
+        under = pc.fill_null(pc.starts_with(paths, pattern=prefix), False)
+        select = pc.or_(under, equal)
+        if done is not None:
+            select = pc.and_(select, pc.invert(done))
+        new = pc.if_else(equal, dst, pc.binary_join_element_wise(dst_prefix, tails, ''))
+        out = pc.if_else(select, new, out)
+        done = select if done is None else pc.or_(done, select)
+    return out
@@ -0,0 +1,145 @@
+"""
+Adaptive concurrency limits following containers' CPU utilization
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from . import _log as log
+from . import _docker as docker
+from ._sched import slot_key
+
+
+class Autotuner(object):
+    """
+    Adjust 'scheduler' limits per container to reach a 'target' CPU utilization
+
+    Every 'interval' seconds (see 'start()', or call 'step()' directly), the
+    CPU usage of each container is read from 'docker stats', as well as CPU
+    throttling from the container cgroup ('cpu.stat'). Following AIMD, the
+    number of commands allowed to run concurrently in a container is:
+    * increased by one if utilization is below 'target' and commands are
+      waiting in queue for that container;
+    * multiplied by 'decrease' if utilization is above 'target' or the
+      container CPU got throttled since the last step.
+
+    Each step's decision is kept in 'decisions' (the last 'history' ones).
+
+    Input:
+        scheduler: shoosh.Scheduler
+            Scheduler whose limits are adjusted
+        containers: list
+            Names of the containers to follow
+        host: str
+            Docker daemon endpoint of the containers, if not default
+        target: float
+            Target CPU utilization (0-1) of the CPUs available to containers
+        min_limit, max_limit: int
+            Bounds of the concurrency limit per container
+    """
+    def __init__(self, scheduler, containers:list, target:float=0.8,
+                 interval:float=5, min_limit:int=1, max_limit:int=None,
+                 decrease:float=0.5, history:int=1000, host:str=None):
+        assert 0 < target <= 1 and 0 < decrease < 1
+        self._sched = scheduler
+        self._containers = list(containers)
+        self._host = host
+        self._keys = { c: slot_key(c, host) for c in self._containers }
+        self._target = target
+        self._interval = interval
+        self._min = min_limit
+        self._max = max_limit
+        self._decrease = decrease
+        self._throttled = {}
+        self._thread = None
+        self._stop = threading.Event()
+        self.decisions = deque(maxlen=history)
+
+        infos = docker.inspect_many(self._containers, host)
+        self._cpus = { c: (infos.get(c) or {}).get('cpus') or os.cpu_count()
+                       for c in self._containers }
+        for c, key in self._keys.items():
+            if self._sched.limit(key) is None:
+                self._sched.set_limit(key, max(self._min, int(self._cpus[c])))
+
+    def start(self):
+        """
+        Run 'step()' every 'interval' seconds in a background thread
+        """
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def step(self) -> list:
+        """
+        Read containers' CPU usage and adjust their limits, return decisions
+        """
+        usage = docker.cpu_usage(self._containers, self._host)
+        queued = self._sched.stats()
+        decisions = []
+        for c in self._containers:
+            if c not in usage:
+                log.warning(f"No CPU usage for container '{c}'")
+                continue
+            util = usage[c] / self._cpus[c]
+            throttled = self._throttling(c)
+            key = self._keys[c]
+            waiting = queued.get(key, {}).get('queued', 0)
+            limit = self._sched.limit(key)
+
+            if throttled or util > self._target:
+                new = max(self._min, int(limit * self._decrease))
+                reason = 'throttled' if throttled else 'above target'
+            elif waiting and util < self._target:
+                new = limit + 1
+                reason = 'below target'
+            else:
+                new = limit
+                reason = 'hold'
+            if self._max is not None:
+                new = min(new, self._max)
+
+            if new != limit:
+                self._sched.set_limit(key, new)
+                log.debug(f"Container '{c}' limit {limit} -> {new} ({reason})")
+            decision = dict(time = time.time(),
+                            container = c,
+                            utilization = util,
+                            throttled = throttled,
+                            queued = waiting,
+                            limit = limit,
+                            new_limit = new,
+                            reason = reason)
+            decisions.append(decision)
+            self.decisions.append(decision)
+        return decisions
+
+    def _throttling(self, container):
+        """
+        Return number of throttled periods since last call
+        """
+        count = docker.cpu_throttling(container, self._host)
+        if count is None:
+            return 0
+        last = self._throttled.get(container, count)
+        self._throttled[container] = count
+        return count - last
+
+    def _loop(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.step()
+            except Exception as err:
+                log.error(err)